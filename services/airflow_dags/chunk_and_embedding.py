@@ -1,22 +1,85 @@
-from pdf_chunk_flow import MacroEtlPdfChunks
-from embedding_flow.transform.transform import transform_embedding
-from embedding_flow.load.load import load_embedding
+from pdf_chunk_flow import parquet_loader_instance, pdf_transformer_instance
 import pendulum
 from confluent_kafka import Producer
 import redis
 import json
 import hashlib
+import re
 from datetime import timedelta
 from airflow.decorators import dag, task
 import os
+import uuid
+import time
 import logging
+import threading
+import unicodedata
+import zlib
+import multiprocessing
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+from urllib.parse import urlparse
+import requests
+import numpy as np
 import pandas as pd
+import pyarrow.parquet as pq
+from qdrant_client import QdrantClient
+from qdrant_client.models import (
+    CreateAlias, CreateAliasOperation, DeleteAlias, DeleteAliasOperation, Disabled, Distance, FieldCondition, Filter, HnswConfigDiff, MatchValue, Modifier, PayloadSchemaType, PointIdsList,
+    PointStruct, ScalarQuantization, ScalarQuantizationConfig, ScalarType, SparseVector, SparseVectorParams,
+    VectorParams, VectorParamsDiff,
+)
 
 REDIS_HOST = os.getenv("REDIS_HOST", "redis")
 REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
 KAFKA_BROKER = os.getenv("KAFKA_BROKER", "kafka:9092")
 KAFKA_TOPIC = os.getenv("KAFKA_TOPIC", "etl-events")
 
+# Colección de documentos (mismas variables que embedding_flow)
+QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
+QDRANT_API_KEY = os.getenv("QDRANT_API_KEY", None)
+QDRANT_COLLECTION = os.getenv("QDRANT_COLLECTION", "embeddings_collection")
+VECTOR_SIZE = int(os.getenv("VECTOR_SIZE", "768"))
+
+# Configuración de memoria de la colección: tiene que coincidir con langchains_service/models/qdrant_collections.py
+QDRANT_QUANTIZATION_ENABLED = os.getenv("QDRANT_QUANTIZATION_ENABLED", "true").lower() == "true"
+QDRANT_QUANTIZATION_QUANTILE = float(os.getenv("QDRANT_QUANTIZATION_QUANTILE", 0.99))
+QDRANT_VECTORS_ON_DISK = os.getenv("QDRANT_VECTORS_ON_DISK", "true").lower() == "true"
+QDRANT_HNSW_M = int(os.getenv("QDRANT_HNSW_M", 16))
+QDRANT_HNSW_EF_CONSTRUCT = int(os.getenv("QDRANT_HNSW_EF_CONSTRUCT", 128))
+TOPICS_FIELD = "topics"
+# Marca de los chunks ya etiquetados (`topics` vacío no distingue "sin temas" de "sin etiquetar");
+# subir la versión al cambiar TOPIC_TERMS o _temas re-etiqueta el corpus en la próxima corrida
+TOPICS_VERSION_FIELD = "topics_version"
+TOPICS_VERSION = 1
+PAYLOAD_INDEXES = {
+    "source_id": PayloadSchemaType.KEYWORD,
+    TOPICS_FIELD: PayloadSchemaType.KEYWORD,
+    TOPICS_VERSION_FIELD: PayloadSchemaType.INTEGER,
+}
+
+# Vector sparse BM25 para la búsqueda híbrida (Qdrant aplica el IDF con modifier=idf)
+SPARSE_VECTOR_NAME = "bm25"
+BM25_K1 = 1.2
+BM25_B = 0.75
+BM25_AVG_DOC_LEN = 60  # términos por chunk de ~600 caracteres, sin stopwords
+
+# Descarga y chunking concurrente de PDFs
+PDF_FOLDER = "pdf"
+PDF_DOWNLOAD_WORKERS = int(os.getenv("PDF_DOWNLOAD_WORKERS", 8))                    # descargas simultáneas en total
+PDF_PARSE_WORKERS = int(os.getenv("PDF_PARSE_WORKERS", min(4, os.cpu_count() or 1)))  # procesos que parsean y chunkean
+PDF_MAX_PER_HOST = int(os.getenv("PDF_MAX_PER_HOST", 2))                            # descargas simultáneas por host
+PDF_HOST_MIN_INTERVAL = float(os.getenv("PDF_HOST_MIN_INTERVAL", 0.5))              # segundos entre requests a un mismo host
+PDF_DOWNLOAD_TIMEOUT = int(os.getenv("PDF_DOWNLOAD_TIMEOUT", 60))
+
+# Mismo modelo que embedding_flow (vectores de 768 dimensiones)
+EMBEDDING_MODEL = "all-mpnet-base-v2"
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 256))                  # filas leídas y embebidas por batch
+EMBEDDING_MAX_PARALLEL_FILES = int(os.getenv("EMBEDDING_MAX_PARALLEL_FILES", 4))    # documentos embebidos en paralelo
+QDRANT_UPSERT_WORKERS = int(os.getenv("QDRANT_UPSERT_WORKERS", 2))                  # upserts concurrentes por documento
+
 r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
 
 # Confluent Kafka Producer configuration
@@ -30,6 +93,257 @@ logger = logging.getLogger(__name__)
 
 URLS_FILE = os.path.join(os.path.dirname(__file__), "urls.txt")
 
+# Estado de la ingesta incremental en Redis
+DOCS_KEY = "ingest:docs"                  # set con el url_hash de cada documento ingestado
+DOC_KEY_PREFIX = "ingest:doc:"            # hash por documento: url y hash del contenido
+CHUNKS_KEY_PREFIX = "ingest:chunks:"      # set por documento con los hashes de sus chunks
+
+
+def _url_hash(url: str) -> str:
+    return hashlib.md5(url.encode()).hexdigest()
+
+
+class HostRateLimiter:
+    """Limita las descargas concurrentes y la frecuencia de requests por host"""
+
+    def __init__(self, max_per_host: int = PDF_MAX_PER_HOST, min_interval: float = PDF_HOST_MIN_INTERVAL):
+        self.max_per_host = max_per_host
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._semaphores = {}
+        self._next_request = {}
+
+    @contextmanager
+    def slot(self, url: str):
+        host = urlparse(url).netloc
+        with self._lock:
+            semaphore = self._semaphores.setdefault(host, threading.BoundedSemaphore(self.max_per_host))
+        with semaphore:
+            # Reserva el próximo turno del host y espera fuera del lock
+            with self._lock:
+                now = time.monotonic()
+                start = max(now, self._next_request.get(host, now))
+                self._next_request[host] = start + self.min_interval
+            time.sleep(start - now)
+            yield
+
+
+def _descargar_pdf(session: requests.Session, limiter: HostRateLimiter, url: str, url_hash: str,
+                   etag: Optional[str], last_modified: Optional[str]) -> Optional[dict]:
+    """
+    Descarga un PDF con un request condicional (ETag/Last-Modified).
+
+    Retorna None si el servidor responde 304 (sin cambios desde la última ingesta).
+    """
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
+    with limiter.slot(url):
+        with session.get(url, headers=headers, stream=True, timeout=PDF_DOWNLOAD_TIMEOUT) as response:
+            if response.status_code == 304:
+                return None
+            response.raise_for_status()
+
+            # Nombre por hash de la URL: dos PDFs con el mismo nombre de archivo no se pisan
+            pdf_path = os.path.join(PDF_FOLDER, f"{url_hash}.pdf")
+            with open(pdf_path, "wb") as f:
+                for chunk in response.iter_content(chunk_size=65536):
+                    f.write(chunk)
+
+            return {
+                "pdf_path": pdf_path,
+                "etag": response.headers.get("ETag", ""),
+                "last_modified": response.headers.get("Last-Modified", ""),
+            }
+
+
+def _iter_chunks(parquet_path: str, solo_texto: bool = False) -> Iterator[pd.DataFrame]:
+    """
+    Lee los chunks de un PDF por batches de row-groups, sin cargar el archivo completo.
+
+    Renombra `chunk_text` a `text` en memoria y agrega el hash de contenido de cada chunk.
+    """
+    parquet = pq.ParquetFile(parquet_path)
+    columns = None
+    if solo_texto:
+        columns = ["chunk_text" if "chunk_text" in parquet.schema_arrow.names else "text"]
+
+    for batch in parquet.iter_batches(batch_size=EMBEDDING_BATCH_SIZE, columns=columns):
+        df = batch.to_pandas().rename(columns={'chunk_text': 'text'})
+        df["chunk_hash"] = [hashlib.sha256(text.encode()).hexdigest() for text in df["text"]]
+        yield df
+
+
+def _doc_hash(parquet_path: str) -> str:
+    """Hash del documento: cambia si cambia, se agrega o se quita cualquier chunk"""
+    doc_hash = hashlib.sha256()
+    for df in _iter_chunks(parquet_path, solo_texto=True):
+        for chunk_hash in df["chunk_hash"]:
+            doc_hash.update(chunk_hash.encode())
+    return doc_hash.hexdigest()
+
+
+_model = None
+
+
+def _get_model():
+    """Modelo de embeddings, cargado una sola vez por proceso (import diferido para no frenar el parseo del DAG)"""
+    global _model
+    if _model is None:
+        from sentence_transformers import SentenceTransformer
+        _model = SentenceTransformer(EMBEDDING_MODEL)
+    return _model
+
+
+def _point_id(url_hash: str, chunk_hash: str) -> str:
+    """
+    ID determinístico del punto en Qdrant derivado del hash del chunk.
+
+    Se acota al documento para que un chunk repetido en dos PDFs no comparta punto
+    (borrarlo de uno no debe afectar al otro).
+    """
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{url_hash}:{chunk_hash}"))
+
+
+def _cliente_qdrant() -> QdrantClient:
+    return QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY)
+
+
+# Las reconstrucciones se cargan en una colección versionada y QDRANT_COLLECTION pasa a ser un alias hacia ella
+def _es_version(name: str) -> bool:
+    return re.fullmatch(rf"{re.escape(QDRANT_COLLECTION)}_v\d+", name) is not None
+
+
+def _destino_alias(client: QdrantClient) -> Optional[str]:
+    """Colección a la que apunta el alias QDRANT_COLLECTION (None si no hay alias)"""
+    for alias in client.get_aliases().aliases:
+        if alias.alias_name == QDRANT_COLLECTION:
+            return alias.collection_name
+    return None
+
+
+def _borrar_versiones_anteriores(client: QdrantClient, activa: str):
+    """Borra las colecciones versionadas que no son la activa (la reemplazada y reconstrucciones que fallaron)"""
+    for collection in client.get_collections().collections:
+        if _es_version(collection.name) and collection.name != activa:
+            client.delete_collection(collection.name)
+            logger.info(f"🗑️ Colección anterior borrada: {collection.name}")
+
+
+# Tokenización BM25: tiene que coincidir con langchains_service/models/bm25.py
+# (lo verifica `python -m models.ingest_parity` desde langchains_service, junto con TOPIC_TERMS y _temas)
+STOPWORDS = frozenset("""
+    a al algo con como de del el en es esta este ha la las le lo los me mi mis no o para pero por que se si sin
+    su sus te tu tus un una uno unos unas y ya
+""".split())
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def _tokenizar(text: str) -> list:
+    """Minúsculas, sin acentos, sin stopwords ni tokens de una letra"""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return [token for token in _TOKEN_RE.findall(text) if len(token) > 1 and token not in STOPWORDS]
+
+
+def _sparse_bm25(text: str) -> SparseVector:
+    """Pesos de frecuencia BM25 (saturación k1 y normalización por largo) indexados por crc32 del término"""
+    tf = Counter(zlib.crc32(token.encode()) for token in _tokenizar(text))
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * sum(tf.values()) / BM25_AVG_DOC_LEN)
+    return SparseVector(
+        indices=list(tf.keys()),
+        values=[freq * (BM25_K1 + 1) / (freq + norm) for freq in tf.values()],
+    )
+
+
+# Temas de cada chunk: tienen que coincidir con DOC_FILTERS de langchains_service/chain/intents.py (models.ingest_parity)
+TOPIC_TERMS = {
+    "dirigite": ("dirigite",),
+    "cajero": ("cajero",),
+    "banelco": ("banelco",),
+    "tarjeta": ("tarjeta", "débito", "debito"),
+    "claves": ("claves", "generación", "generacion"),
+    "token": ("token", "cajero", "generación", "generacion", "clave", "activación", "activacion", "seguridad",
+              "app macro", "banco macro"),
+}
+
+
+def _temas(text: str) -> list:
+    """Etiquetas de tema del chunk (payload indexado que usa el retrieval para filtrar en Qdrant)"""
+    text = text.lower()
+    terms = {group for group, words in TOPIC_TERMS.items() if any(word in text for word in words)}
+    topics = []
+    if "cajero" in terms and ("dirigite" in terms or "banelco" in terms or ("tarjeta" in terms and "claves" in terms)):
+        topics.append("cajero")
+    if "token" in terms:
+        topics.append("token")
+    return topics
+
+
+def _sin_temas() -> Filter:
+    """Chunks sin etiquetar o etiquetados con otra versión de las reglas"""
+    return Filter(must_not=[FieldCondition(key=TOPICS_VERSION_FIELD, match=MatchValue(value=TOPICS_VERSION))])
+
+
+def _etiquetar_chunks_existentes(client: QdrantClient, batch_size: int = 256) -> int:
+    """Agrega las etiquetas de tema a los chunks ingestados antes de que existieran (sin re-embeber)"""
+    sin_temas = _sin_temas()
+    tagged = 0
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=QDRANT_COLLECTION, scroll_filter=sin_temas, limit=batch_size, offset=offset,
+            with_payload=["text"], with_vectors=False,
+        )
+        by_topics = {}
+        for point in points:
+            topics = tuple(_temas((point.payload or {}).get("text", "")))
+            by_topics.setdefault(topics, []).append(point.id)
+        for topics, ids in by_topics.items():
+            client.set_payload(
+                collection_name=QDRANT_COLLECTION,
+                payload={TOPICS_FIELD: list(topics), TOPICS_VERSION_FIELD: TOPICS_VERSION},
+                points=ids,
+            )
+        tagged += len(points)
+        if offset is None:
+            return tagged
+
+
+def _upsert_chunks(client: QdrantClient, coleccion: str, df: pd.DataFrame, embeddings: np.ndarray, url: str, url_hash: str):
+    """Sube los chunks embebidos con IDs determinísticos (re-ejecutar es idempotente)"""
+    points = []
+    for row, vector in zip(df.to_dict("records"), embeddings):
+        row.update(source_url=url, source_id=url_hash, topics=_temas(row["text"]), topics_version=TOPICS_VERSION)
+        points.append(PointStruct(
+            id=_point_id(url_hash, row["chunk_hash"]),
+            vector={"": vector.tolist(), SPARSE_VECTOR_NAME: _sparse_bm25(row["text"])},
+            payload=row,
+        ))
+    client.upsert(collection_name=coleccion, points=points)
+
+
+def _quantization_config() -> Optional[ScalarQuantization]:
+    if not QDRANT_QUANTIZATION_ENABLED:
+        return None
+    return ScalarQuantization(
+        scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=QDRANT_QUANTIZATION_QUANTILE, always_ram=True)
+    )
+
+
+def _borrar_estado_ingesta():
+    """Olvida qué documentos y chunks se ingestaron (la próxima corrida reingesta todo)"""
+    pipe = r.pipeline(transaction=False)
+    for url_hash in r.smembers(DOCS_KEY):
+        pipe.delete(f"{DOC_KEY_PREFIX}{url_hash}", f"{CHUNKS_KEY_PREFIX}{url_hash}")
+    pipe.delete(DOCS_KEY)
+    pipe.execute()
+
+
 @dag(
     dag_id="chunkear_and_embedding",
     schedule="@daily",
@@ -41,13 +355,71 @@ URLS_FILE = os.path.join(os.path.dirname(__file__), "urls.txt")
 def chunkear_and_embedding():
     """
     DAG que:
+    0️⃣ Prepara la colección de Qdrant (vectores densos + sparse BM25)
     1️⃣ Lee URLs desde urls.txt
-    2️⃣ Evita reprocesar PDFs usando Redis
-    3️⃣ Chunkifica los PDFs en Parquet
-    4️⃣ Genera embeddings y los carga en Qdrant
-    5️⃣ Publica evento 'etl_done' en Kafka
+    2️⃣ Descarga en paralelo los PDFs modificados (requests condicionales) y los chunkifica en Parquet
+    3️⃣ Detecta con hashes de contenido (en Redis) qué documentos y chunks cambiaron
+    4️⃣ Genera embeddings (densos y BM25) solo de los chunks nuevos, los etiqueta por tema, los carga en Qdrant y borra los que ya no existen
+    5️⃣ Si la colección se reconstruyó, mueve el alias a la nueva (sin cortar las búsquedas)
+    6️⃣ Publica evento 'etl_done' en Kafka si hubo cambios
     """
 
+    @task()
+    def preparar_coleccion():
+        """
+        Prepara la colección de documentos (vectores densos + sparse BM25) y devuelve
+        el nombre donde escribe esta corrida.
+
+        Si la colección vigente ya tiene el vector BM25 se migra en el lugar y se
+        escribe en QDRANT_COLLECTION. Si no existe o no tiene BM25, el corpus se
+        reingesta completo en una colección nueva `<QDRANT_COLLECTION>_v<timestamp>`.
+        La vigente sigue sirviendo hasta que activar_coleccion mueve el alias.
+        """
+        client = _cliente_qdrant()
+        hnsw_config = HnswConfigDiff(m=QDRANT_HNSW_M, ef_construct=QDRANT_HNSW_EF_CONSTRUCT)
+        if client.collection_exists(QDRANT_COLLECTION):
+            info = client.get_collection(QDRANT_COLLECTION)
+            if SPARSE_VECTOR_NAME in (info.config.params.sparse_vectors or {}):
+                # Colección vigente: aplicar la configuración de memoria e índices si cambiaron
+                vectors = info.config.params.vectors
+                hnsw = info.config.hnsw_config
+                if (
+                    bool(getattr(vectors, "on_disk", False)) != QDRANT_VECTORS_ON_DISK
+                    or (hnsw.m, hnsw.ef_construct) != (QDRANT_HNSW_M, QDRANT_HNSW_EF_CONSTRUCT)
+                    or info.config.quantization_config != _quantization_config()
+                ):
+                    client.update_collection(
+                        collection_name=QDRANT_COLLECTION,
+                        vectors_config={"": VectorParamsDiff(on_disk=QDRANT_VECTORS_ON_DISK)},
+                        hnsw_config=hnsw_config,
+                        quantization_config=_quantization_config() or Disabled.DISABLED,
+                    )
+                    logger.info(f"🔧 Colección '{QDRANT_COLLECTION}' migrada a la configuración de memoria actual")
+                for field, schema in PAYLOAD_INDEXES.items():
+                    if field not in (info.payload_schema or {}):
+                        client.create_payload_index(collection_name=QDRANT_COLLECTION, field_name=field, field_schema=schema)
+                # Se decide por los puntos sin etiquetar y no por el índice: langchains_service crea el
+                # índice `topics` al arrancar, que puede ser antes de la primera corrida del DAG
+                if client.count(QDRANT_COLLECTION, count_filter=_sin_temas(), exact=False).count:
+                    logger.info(f"🏷️ {_etiquetar_chunks_existentes(client)} chunks existentes etiquetados con sus temas")
+                return QDRANT_COLLECTION
+            logger.warning(f"⚠️ La colección {QDRANT_COLLECTION} no tiene vectores BM25: se reconstruye en una colección nueva")
+
+        coleccion = f"{QDRANT_COLLECTION}_v{int(time.time())}"
+        _borrar_estado_ingesta()
+        client.create_collection(
+            collection_name=coleccion,
+            # Originales en disco (para el rescoring) y vectores int8 en RAM para el HNSW
+            vectors_config=VectorParams(size=VECTOR_SIZE, distance=Distance.COSINE, on_disk=QDRANT_VECTORS_ON_DISK),
+            sparse_vectors_config={SPARSE_VECTOR_NAME: SparseVectorParams(modifier=Modifier.IDF)},
+            hnsw_config=hnsw_config,
+            quantization_config=_quantization_config(),
+        )
+        for field, schema in PAYLOAD_INDEXES.items():
+            client.create_payload_index(collection_name=coleccion, field_name=field, field_schema=schema)
+        logger.info(f"✅ Colección '{coleccion}' creada (densa + BM25, int8={QDRANT_QUANTIZATION_ENABLED})")
+        return coleccion
+
     @task()
     def leer_urls():
         """Lee el archivo urls.txt y devuelve la lista de URLs"""
@@ -57,79 +429,208 @@ def chunkear_and_embedding():
 
     @task()
     def chunkear_pdfs(urls: list):
-        """Ejecuta el ETL de chunking de PDFs y retorna lista de parquets"""
-        parquet_paths = []
-        for url in urls:
-            url_hash = hashlib.md5(url.encode()).hexdigest()
-            
-            if r.sismember("processed_urls", url_hash):
-                logger.info(f"pdf ya procesado: {url}")
-                continue
-            
-            parquet_path = MacroEtlPdfChunks(url)
-            if parquet_path is None:
-                raise Exception(f"❌ Error al procesar PDF desde {url}")
-            
-            r.sadd("processed_urls", url_hash)
-            parquet_paths.append(parquet_path)
-            logger.info(f"✅ PDF chunkificado: {url}")
-
-        return parquet_paths
+        """
+        Descarga y chunkifica los PDFs en paralelo y retorna los documentos cuyo contenido cambió.
 
-    @task()
-    def generar_embeddings(parquet_paths: list):
-        """Genera embeddings desde los Parquets y los carga en Qdrant"""
-        results = []
-        
-        # Inicializar loader una sola vez (reutiliza conexión a Qdrant)
-        loader = load_embedding()
-        
-        for parquet_path in parquet_paths:
-            try:
-                # 0️⃣ Preparar: renombrar columna chunk_text a text
-                df = pd.read_parquet(parquet_path)
-                if 'chunk_text' in df.columns:
-                    df = df.rename(columns={'chunk_text': 'text'})
-                    # Guardar temporalmente con la columna renombrada
-                    temp_parquet = parquet_path.replace('.parquet', '_temp.parquet')
-                    df.to_parquet(temp_parquet, index=False)
-                    parquet_to_process = temp_parquet
-                else:
-                    parquet_to_process = parquet_path
-                
-                # 1️⃣ Transformar: generar embeddings
-                transformer = transform_embedding()
-                embedded_parquet = transformer.transform_data(parquet_to_process)
-                
-                if embedded_parquet is None:
-                    raise Exception(f"Error al generar embeddings")
-                
-                # 2️⃣ Cargar: subir a Qdrant
-                success = loader.load_data(embedded_parquet)
-                
-                if not success:
-                    raise Exception(f"Error al cargar embeddings a Qdrant")
-                
-                results.append(embedded_parquet)
-                logger.info(f"✅ Procesado: {parquet_path} -> {embedded_parquet}")
-                
-                # Limpiar archivo temporal
-                if 'temp_parquet' in locals() and os.path.exists(temp_parquet):
-                    os.remove(temp_parquet)
-                
-            except Exception as e:
-                logger.error(f"❌ Error procesando {parquet_path}: {e}")
-                raise Exception(f"❌ Error al procesar {parquet_path}: {e}")
-        
-        return f"✅ {len(results)} archivos procesados correctamente"
+        Las descargas corren en threads (con límites por host y requests condicionales)
+        y, a medida que terminan, el parseo y chunking pasa a un pool de procesos.
+        """
+        url_hashes = [_url_hash(url) for url in urls]
+
+        # Estado previo de todos los documentos en un solo round trip
+        pipe = r.pipeline(transaction=False)
+        for url_hash in url_hashes:
+            pipe.hmget(f"{DOC_KEY_PREFIX}{url_hash}", "doc_hash", "etag", "last_modified")
+        estados = pipe.execute()
+
+        Path(PDF_FOLDER).mkdir(parents=True, exist_ok=True)
+        limiter = HostRateLimiter()
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=PDF_DOWNLOAD_WORKERS)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+
+        documentos, errores = [], []
+        sin_cambios = r.pipeline(transaction=False)
+        # spawn: hacer fork con threads de descarga activos puede dejar locks tomados en el hijo
+        with ThreadPoolExecutor(max_workers=PDF_DOWNLOAD_WORKERS) as descargas, \
+                ProcessPoolExecutor(max_workers=PDF_PARSE_WORKERS, mp_context=multiprocessing.get_context("spawn")) as parseo:
+            futuros_descarga = {
+                descargas.submit(_descargar_pdf, session, limiter, url, url_hash, etag, last_modified): (url, url_hash, doc_hash)
+                for url, url_hash, (doc_hash, etag, last_modified) in zip(urls, url_hashes, estados)
+            }
+
+            futuros_chunking = {}
+            for futuro in as_completed(futuros_descarga):
+                url, url_hash, doc_hash = futuros_descarga[futuro]
+                try:
+                    descarga = futuro.result()
+                except Exception as e:
+                    errores.append(f"{url}: {e}")
+                    continue
+
+                if descarga is None:
+                    logger.info(f"pdf sin cambios (304): {url}")
+                    continue
+
+                futuro_chunking = parseo.submit(pdf_transformer_instance.transform, descarga["pdf_path"])
+                futuros_chunking[futuro_chunking] = (url, url_hash, doc_hash, descarga)
+
+            for futuro in as_completed(futuros_chunking):
+                url, url_hash, doc_hash_previo, descarga = futuros_chunking[futuro]
+                try:
+                    parquet_path = parquet_loader_instance.load(futuro.result())
+                except Exception as e:
+                    errores.append(f"{url}: {e}")
+                    continue
+
+                validadores = {"etag": descarga["etag"], "last_modified": descarga["last_modified"]}
+                doc_hash = _doc_hash(parquet_path)
+                if doc_hash == doc_hash_previo:
+                    # Mismo contenido: solo se actualizan los validadores HTTP
+                    sin_cambios.hset(f"{DOC_KEY_PREFIX}{url_hash}", mapping=validadores)
+                    logger.info(f"pdf sin cambios: {url}")
+                    continue
+
+                documentos.append({"url": url, "url_hash": url_hash, "parquet_path": parquet_path, "doc_hash": doc_hash, **validadores})
+                logger.info(f"✅ PDF chunkificado: {url}")
+
+        sin_cambios.execute()
+        session.close()
+
+        if errores:
+            raise Exception(f"❌ Error al procesar PDFs: {'; '.join(errores)}")
+
+        return documentos
+
+    @task(max_active_tis_per_dag=EMBEDDING_MAX_PARALLEL_FILES)
+    def generar_embeddings(documento: dict, coleccion: str):
+        """
+        Genera embeddings de los chunks nuevos de un documento, los carga en Qdrant
+        y borra los chunks retirados.
+
+        Se mapea dinámicamente sobre los documentos modificados (uno por task) y
+        procesa el parquet en streaming: mientras se embebe un batch, los anteriores
+        se suben a Qdrant en segundo plano.
+        """
+        url, url_hash, parquet_path = documento["url"], documento["url_hash"], documento["parquet_path"]
+        chunks_key = f"{CHUNKS_KEY_PREFIX}{url_hash}"
+        try:
+            client = _cliente_qdrant()
+            model = _get_model()
+
+            conocidos = r.smembers(chunks_key)
+            actuales = set()
+            nuevos = 0
+            pendientes = deque()
+
+            with ThreadPoolExecutor(max_workers=QDRANT_UPSERT_WORKERS) as pool:
+                for df in _iter_chunks(parquet_path):
+                    # 0️⃣ Delta: solo chunks que no estaban ingestados (ni repetidos en el documento)
+                    batch = df[~df["chunk_hash"].isin(conocidos) & ~df["chunk_hash"].isin(actuales)]
+                    batch = batch.drop_duplicates("chunk_hash")
+                    actuales.update(df["chunk_hash"])
+                    if batch.empty:
+                        continue
+
+                    # 1️⃣ Transformar: generar embeddings del batch
+                    embeddings = model.encode(batch["text"].tolist(), batch_size=64, convert_to_numpy=True)
+
+                    # 2️⃣ Cargar: subir a Qdrant con IDs determinísticos sin bloquear el siguiente batch
+                    pendientes.append(pool.submit(_upsert_chunks, client, coleccion, batch, embeddings, url, url_hash))
+                    nuevos += len(batch)
+
+                    # Acota los upserts en vuelo para que la memoria no crezca con el documento
+                    while len(pendientes) > QDRANT_UPSERT_WORKERS:
+                        pendientes.popleft().result()
+
+                for pendiente in pendientes:
+                    pendiente.result()
+
+            # 3️⃣ Borrar los chunks que ya no existen en el documento
+            retirados = conocidos - actuales
+            if retirados:
+                client.delete(
+                    collection_name=coleccion,
+                    points_selector=PointIdsList(points=[_point_id(url_hash, h) for h in retirados]),
+                )
+
+            # 4️⃣ Registrar el nuevo estado recién después de actualizar Qdrant
+            pipe = r.pipeline()
+            pipe.delete(chunks_key)
+            pipe.sadd(chunks_key, *actuales)
+            pipe.hset(f"{DOC_KEY_PREFIX}{url_hash}", mapping={
+                "url": url,
+                "doc_hash": documento["doc_hash"],
+                "etag": documento["etag"],
+                "last_modified": documento["last_modified"],
+            })
+            pipe.sadd(DOCS_KEY, url_hash)
+            pipe.execute()
+
+            logger.info(f"✅ Procesado: {url} ({nuevos} chunks nuevos, {len(retirados)} eliminados)")
+            return nuevos
+
+        except Exception as e:
+            logger.error(f"❌ Error procesando {parquet_path}: {e}")
+            raise Exception(f"❌ Error al procesar {parquet_path}: {e}")
 
     @task()
-    def publicar_evento_kafka(processed_count):
-        """Publica evento 'etl_done' en Kafka"""
+    def retirar_documentos(urls: list, coleccion: str):
+        """Borra de Qdrant y de Redis los documentos cuya URL ya no está en urls.txt"""
+        retirados = r.smembers(DOCS_KEY) - {_url_hash(url) for url in urls}
+        if not retirados:
+            return 0
+
+        client = _cliente_qdrant()
+        for url_hash in retirados:
+            client.delete(
+                collection_name=coleccion,
+                points_selector=Filter(must=[FieldCondition(key="source_id", match=MatchValue(value=url_hash))]),
+            )
+            r.delete(f"{DOC_KEY_PREFIX}{url_hash}", f"{CHUNKS_KEY_PREFIX}{url_hash}")
+            r.srem(DOCS_KEY, url_hash)
+            logger.info(f"🗑️ Documento retirado: {url_hash}")
+
+        return len(retirados)
+
+    @task(trigger_rule="none_failed")
+    def activar_coleccion(coleccion: str):
+        """
+        Apunta el alias QDRANT_COLLECTION a la colección reconstruida y borra las anteriores.
+
+        El cambio de alias es atómico. La única excepción es la primera migración:
+        si QDRANT_COLLECTION todavía es una colección física hay que borrarla antes
+        de crear el alias. En ese intervalo de milisegundos las búsquedas fallan.
+        """
+        if coleccion == QDRANT_COLLECTION:
+            return
+        client = _cliente_qdrant()
+        anterior = _destino_alias(client)
+        operaciones = []
+        if anterior is not None:
+            operaciones.append(DeleteAliasOperation(delete_alias=DeleteAlias(alias_name=QDRANT_COLLECTION)))
+        elif client.collection_exists(QDRANT_COLLECTION):
+            anterior = QDRANT_COLLECTION
+            client.delete_collection(QDRANT_COLLECTION)
+        operaciones.append(CreateAliasOperation(create_alias=CreateAlias(collection_name=coleccion, alias_name=QDRANT_COLLECTION)))
+        client.update_collection_aliases(change_aliases_operations=operaciones)
+        logger.info(f"🔀 Alias '{QDRANT_COLLECTION}' -> '{coleccion}' (anterior: {anterior})")
+        _borrar_versiones_anteriores(client, coleccion)
+
+    @task(trigger_rule="none_failed")
+    def publicar_evento_kafka(documentos: list, removed_count: int):
+        """Publica evento 'etl_done' en Kafka (solo si el corpus cambió)"""
+        processed_count = len(documentos)
+        if not processed_count and not removed_count:
+            logger.info("ℹ️ Sin cambios en el corpus, no se publica evento")
+            return
+
         data = {
             "event": "etl_done",
             "timestamp":  pendulum.now().to_iso8601_string(),
             "processed_count": processed_count,
+            "removed_count": removed_count,
         }
         
         # Convert data to JSON string
@@ -145,9 +646,13 @@ def chunkear_and_embedding():
 
     # Flujo del DAG
     urls = leer_urls()
-    parquet_paths = chunkear_pdfs(urls)
-    processed_count = generar_embeddings(parquet_paths)
-    publicar_evento_kafka(processed_count)
+    coleccion = preparar_coleccion()
+    coleccion >> urls
+    documentos = chunkear_pdfs(urls)
+    embeddings = generar_embeddings.partial(coleccion=coleccion).expand(documento=documentos)
+    removed_count = retirar_documentos(urls, coleccion)
+    # Con trigger_rule none_failed activa y publica aunque no haya documentos para mapear (task mapeada en skipped)
+    embeddings >> activar_coleccion(coleccion) >> publicar_evento_kafka(documentos, removed_count)
 
 # Inicializa el DAG
 chunkear_and_embedding()
\ No newline at end of file
@@ -1,11 +1,23 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from app.core.rag_client import close_client, start_client
 from app.routes.routes import router as rag_router
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Un único cliente HTTP con pool de conexiones para toda la vida de la app
+    await start_client()
+    yield
+    await close_client()
+
+
 app = FastAPI(
     title="Macro-Flow API Gateway",
     description="API Gateway para orquestar servicios RAG",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Configurar CORS para permitir peticiones desde el frontend
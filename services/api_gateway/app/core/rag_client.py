@@ -0,0 +1,100 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from typing import Optional
+
+import httpx
+
+RAG_TIMEOUT = float(os.getenv("GATEWAY_RAG_TIMEOUT", 120))
+MAX_CONNECTIONS = int(os.getenv("GATEWAY_MAX_CONNECTIONS", 100))
+MAX_KEEPALIVE = int(os.getenv("GATEWAY_MAX_KEEPALIVE", 20))
+MAX_INFLIGHT = int(os.getenv("GATEWAY_MAX_INFLIGHT", 32))
+MAX_QUEUE = int(os.getenv("GATEWAY_MAX_QUEUE", 64))
+QUEUE_TIMEOUT = float(os.getenv("GATEWAY_QUEUE_TIMEOUT", 10))
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+async def start_client():
+    """Crea el cliente HTTP compartido (se llama desde el lifespan de la app)"""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            timeout=RAG_TIMEOUT,
+            limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_KEEPALIVE),
+        )
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def get_client() -> httpx.AsyncClient:
+    if _client is None:
+        raise RuntimeError("Cliente HTTP del gateway no iniciado")
+    return _client
+
+
+class GatewayOverloaded(Exception):
+    """La cola de admisión está llena o la espera superó el timeout"""
+
+
+class AdmissionQueue:
+    """
+    Control de admisión hacia langchains_service.
+
+    Permite `max_inflight` requests en curso y hasta `max_queue` esperando;
+    más allá de eso rechaza en el acto en lugar de dejar que todos esperen el timeout.
+    """
+
+    def __init__(self, max_inflight: int = MAX_INFLIGHT, max_queue: int = MAX_QUEUE, queue_timeout: float = QUEUE_TIMEOUT):
+        self.max_inflight = max(1, max_inflight)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(self.max_inflight)
+        # Requests admitidos (en curso + esperando); se cuenta aparte porque el semáforo
+        # solo refleja los que ya obtuvieron turno
+        self._admitted = 0
+        self.rejected = 0
+
+    async def acquire(self):
+        if self._admitted >= self.max_inflight + self.max_queue:
+            self.rejected += 1
+            raise GatewayOverloaded("Cola de admisión llena")
+        self._admitted += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._admitted -= 1
+            self.rejected += 1
+            raise GatewayOverloaded("Timeout esperando turno en la cola de admisión")
+        except BaseException:
+            self._admitted -= 1
+            raise
+
+    def release(self):
+        self._admitted -= 1
+        self._semaphore.release()
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> dict:
+        return {
+            "inflight": min(self._admitted, self.max_inflight),
+            "waiting": max(0, self._admitted - self.max_inflight),
+            "max_inflight": self.max_inflight,
+            "max_queue": self.max_queue,
+            "rejected": self.rejected,
+        }
+
+
+admission = AdmissionQueue()
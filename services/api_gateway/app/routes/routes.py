@@ -1,9 +1,50 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi.responses import StreamingResponse
+from app.core.rag_client import GatewayOverloaded, admission, get_client
 import httpx
+import json
 
 router = APIRouter()
 
 RAG_SERVICE_URL = "http://langchains_service:8000/query"
+RAG_STREAM_URL = f"{RAG_SERVICE_URL}/stream"
+# Sin límite de lectura entre tokens: el stream puede tener pausas largas en CPU
+STREAM_TIMEOUT = httpx.Timeout(120.0, read=None)
+
+
+def _overloaded(e: GatewayOverloaded) -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail=f"Gateway sobrecargado: {e}. Reintente en unos segundos.",
+        headers={"Retry-After": "5"},
+    )
+
+
+class _RelayResponse(StreamingResponse):
+    """StreamingResponse que ejecuta `on_close` al terminar, aunque el body nunca se haya iterado"""
+
+    def __init__(self, content, on_close, **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.on_close()
+
+
+async def _iter_sse_events(response: httpx.Response):
+    """Parsea el stream SSE del servicio RAG y emite (evento, datos)"""
+    event, data_lines = "message", []
+    async for line in response.aiter_lines():
+        if line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data_lines.append(line[len("data:"):].strip())
+        elif not line and data_lines:
+            yield event, json.loads("\n".join(data_lines))
+            event, data_lines = "message", []
 
 @router.post("/")
 async def queryrag(payload: dict):
@@ -14,8 +55,9 @@ async def queryrag(payload: dict):
             "thread_id": payload.get("thread_id", None)  # Pasar thread_id si existe
         }
         
-        async with httpx.AsyncClient(timeout=120.0) as client:
-            response = await client.post(RAG_SERVICE_URL, json=request_payload)
+        # Admisión: si la cola está llena se rechaza en el acto en vez de esperar el timeout
+        async with admission.slot():
+            response = await get_client().post(RAG_SERVICE_URL, json=request_payload)
             response.raise_for_status()  # Lanza excepción si status >= 400
             
             # Verificar si la respuesta es JSON válido
@@ -28,6 +70,10 @@ async def queryrag(payload: dict):
                     detail=f"Respuesta inválida del servicio RAG: {response.text[:200]}"
                 )
                 
+    except GatewayOverloaded as e:
+        raise _overloaded(e)
+    except HTTPException:
+        raise
     except httpx.ConnectError:
         raise HTTPException(
             status_code=503,
@@ -54,26 +100,131 @@ async def queryrag(payload: dict):
             status_code=500,
             detail=f"Error interno: {str(e)}"
         )
-    
+
+
+@router.post("/stream")
+async def queryrag_stream(payload: dict):
+    """Variante SSE de POST /rag/: reenvía los tokens del servicio RAG a medida que llegan"""
+    request_payload = {
+        "pregunta": payload.get("pregunta", ""),
+        "thread_id": payload.get("thread_id", None)
+    }
+    try:
+        await admission.acquire()
+    except GatewayOverloaded as e:
+        raise _overloaded(e)
+
+    client = get_client()
+    try:
+        request = client.build_request("POST", RAG_STREAM_URL, json=request_payload, timeout=STREAM_TIMEOUT)
+        response = await client.send(request, stream=True)
+    except httpx.ConnectError:
+        admission.release()
+        raise HTTPException(
+            status_code=503,
+            detail="Servicio RAG no disponible. Verifique que langchains_service esté corriendo."
+        )
+    except httpx.TimeoutException:
+        admission.release()
+        raise HTTPException(status_code=504, detail="Timeout conectando con el servicio RAG")
+    except Exception as e:
+        admission.release()
+        raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
+
+    if response.status_code >= 400:
+        error_detail = (await response.aread()).decode(errors="replace")[:200]
+        await response.aclose()
+        admission.release()
+        raise HTTPException(status_code=response.status_code, detail=f"Error del servicio RAG: {error_detail}")
+
+    released = False
+
+    async def finish():
+        # Idempotente: lo llaman tanto el generador como el cierre de la respuesta
+        nonlocal released
+        if released:
+            return
+        released = True
+        admission.release()
+        await response.aclose()
+
+    async def relay():
+        # El turno de admisión se mantiene mientras dure el stream y se libera siempre:
+        # fin normal, error del servicio RAG a mitad del stream o desconexión del cliente.
+        # Si el body nunca empieza a iterarse, lo libera _RelayResponse al cerrar
+        try:
+            async for chunk in response.aiter_raw():
+                yield chunk
+        finally:
+            await finish()
+
+    return _RelayResponse(
+        relay(),
+        finish,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/admission")
+async def admission_stats():
+    """Estado de la cola de admisión hacia el servicio RAG"""
+    return admission.stats()
+
+
+async def _relay_stream(websocket: WebSocket, pregunta: str):
+    """Reenvía por el WebSocket los tokens del servicio RAG como mensajes JSON"""
+    async with get_client().stream("POST", RAG_STREAM_URL, json={"pregunta": pregunta}, timeout=STREAM_TIMEOUT) as response:
+        response.raise_for_status()
+        async for event, data in _iter_sse_events(response):
+            if event == "token":
+                await websocket.send_json({"type": "token", "token": data.get("token", "")})
+            elif event == "done":
+                await websocket.send_json({"type": "done", "respuesta": data.get("respuesta", "")})
+            elif event == "error":
+                await websocket.send_json({"type": "error", "detail": data.get("detail", "")})
+
+
 @router.websocket("/chat")
-async def websocket_endpoint(websocket: WebSocket):
+async def websocket_endpoint(websocket: WebSocket, stream: bool = False):
+    # Con ?stream=true cada mensaje es JSON: {"type": "token"|"done"|"error", ...}
     await websocket.accept()
     await websocket.send_text("🤖 Conexión establecida con el RAG Gateway.")
     try:
         while True:
             data = await websocket.receive_text()
 
+            if stream:
+                try:
+                    async with admission.slot():
+                        await _relay_stream(websocket, data)
+                except GatewayOverloaded:
+                    await websocket.send_json({"type": "error", "detail": "Gateway sobrecargado, reintente en unos segundos"})
+                except httpx.ConnectError:
+                    await websocket.send_json({"type": "error", "detail": "Servicio RAG no disponible"})
+                except httpx.TimeoutException:
+                    await websocket.send_json({"type": "error", "detail": "Timeout esperando respuesta"})
+                except httpx.HTTPStatusError as e:
+                    await websocket.send_json({"type": "error", "detail": f"Error {e.response.status_code}"})
+                except WebSocketDisconnect:
+                    raise
+                except Exception as e:
+                    await websocket.send_json({"type": "error", "detail": str(e)})
+                continue
+
             try:
-                async with httpx.AsyncClient(timeout=120.0) as client:
-                    response = await client.post(RAG_SERVICE_URL, json={"pregunta": data})
-                    response.raise_for_status()
-                    
-                    try:
-                        respuesta = response.json().get("respuesta", "No se obtuvo respuesta del servidor")
-                    except ValueError:
-                        respuesta = f"Error: {response.text[:200]}"
-                    
-                    await websocket.send_text(respuesta)
+                async with admission.slot():
+                    response = await get_client().post(RAG_SERVICE_URL, json={"pregunta": data})
+                response.raise_for_status()
+                
+                try:
+                    respuesta = response.json().get("respuesta", "No se obtuvo respuesta del servidor")
+                except ValueError:
+                    respuesta = f"Error: {response.text[:200]}"
+                
+                await websocket.send_text(respuesta)
+            except GatewayOverloaded:
+                await websocket.send_text("❌ Error: Gateway sobrecargado, reintente en unos segundos")
             except httpx.ConnectError:
                 await websocket.send_text("❌ Error: Servicio RAG no disponible")
             except httpx.TimeoutException:
@@ -84,4 +235,4 @@ async def websocket_endpoint(websocket: WebSocket):
                 await websocket.send_text(f"❌ Error: {str(e)}")
 
     except WebSocketDisconnect:
-        print("❌ Cliente desconectado del WebSocket")
\ No newline at end of file
+        print("❌ Cliente desconectado del WebSocket")
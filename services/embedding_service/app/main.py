@@ -1,15 +1,105 @@
-from fastapi import FastAPI
-from pydantic import BaseModel
-from app.model.embedder import get_embeddings
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from functools import partial
 
-app = FastAPI(title="embedding service 768 dimentions")
+import numpy as np
+from fastapi import FastAPI, Header, HTTPException, Response
+from pydantic import BaseModel, Field
+from typing import Optional
+from app.model.batcher import EmbeddingBatcher
+from app.model.cache import EmbeddingCache
+from app.model.codec import encode_embeddings, negotiate_media_type
+from app.model.embedder import CACHE_MODEL_ID, encode_texts
+from app.model.reranker import load_reranker, reranker_loaded, score_pairs
+
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "true").lower() == "true"
+
+# Cache de embeddings (memoria + disco) delante del modelo
+embedding_cache = EmbeddingCache(CACHE_MODEL_ID)
+
+# Micro-batching: requests concurrentes comparten un único encode
+batcher = EmbeddingBatcher(partial(embedding_cache.encode, encode_fn=encode_texts))
+
+# Mismo micro-batching para el cross-encoder: los pares (pregunta, pasaje) de requests concurrentes van en un solo predict
+rerank_batcher = EmbeddingBatcher(score_pairs)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await batcher.start()
+    if RERANK_ENABLED:
+        try:
+            await asyncio.to_thread(load_reranker)
+        except Exception as e:
+            # Los embeddings siguen disponibles: /rerank reintenta la carga y responde 503 mientras falle
+            print(f"⚠️ No se pudo cargar el modelo de reranking: {e}")
+        await rerank_batcher.start()
+    yield
+    await batcher.stop()
+    await rerank_batcher.stop()
+
+
+app = FastAPI(title="embedding service 768 dimentions", lifespan=lifespan)
 
 class EmbeddingRequest(BaseModel):
     texts: list[str]
 
 
+class RerankRequest(BaseModel):
+    query: str
+    passages: list[str]
+    top_k: Optional[int] = Field(None, ge=1)  # cantidad de pasajes en `results` (todos si no se indica)
+
+
 
 @app.post("/embedding")
-def embeded_text(requests: EmbeddingRequest):
-    embedding = get_embeddings(requests.texts)
-    return embedding
\ No newline at end of file
+async def embeded_text(requests: EmbeddingRequest, accept: Optional[str] = Header(default=None)):
+    # Content negotiation: float32/float16 binario si el cliente lo pide, JSON por defecto
+    media_type = negotiate_media_type(accept)
+
+    if not requests.texts:
+        if media_type:
+            return Response(content=encode_embeddings(np.empty((0, 0)), media_type), media_type=media_type)
+        return []
+
+    # Fast-path: si todo está en el LRU en memoria no se pasa por la cola del batcher
+    cached = embedding_cache.get_many(requests.texts, memory_only=True)
+    if all(vector is not None for vector in cached):
+        embedding = np.stack(cached)
+    else:
+        embedding = await batcher.submit(requests.texts)
+    if media_type:
+        return Response(content=encode_embeddings(embedding, media_type), media_type=media_type)
+    return embedding.tolist()
+
+
+@app.post("/rerank")
+async def rerank(request: RerankRequest):
+    """
+    Relevancia de cada pasaje para la pregunta según el cross-encoder.
+
+    `scores` respeta el orden de `passages`; `results` trae los `top_k` pasajes
+    ({"index", "score"}) de mayor a menor puntaje.
+    """
+    if not RERANK_ENABLED:
+        raise HTTPException(status_code=404, detail="Reranking deshabilitado (RERANK_ENABLED=false)")
+    if not request.passages:
+        return {"scores": [], "results": []}
+    if not reranker_loaded():
+        try:
+            await asyncio.to_thread(load_reranker)
+        except Exception as e:
+            raise HTTPException(status_code=503, detail=f"Modelo de reranking no disponible: {e}")
+
+    scores = await rerank_batcher.submit([(request.query, passage) for passage in request.passages])
+    order = np.argsort(-scores, kind="stable")[:request.top_k]
+    return {
+        "scores": scores.tolist(),
+        "results": [{"index": int(i), "score": float(scores[i])} for i in order],
+    }
+
+
+@app.get("/cache/stats")
+def cache_stats():
+    return embedding_cache.stats()
@@ -0,0 +1,121 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+import numpy as np
+
+BATCH_MAX_SIZE = int(os.getenv("EMBEDDING_BATCH_MAX_SIZE", 64))
+BATCH_MAX_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_MAX_WAIT_MS", 5))
+
+
+class EmbeddingBatcher:
+    """
+    Agrupa requests concurrentes en un único batch para el modelo
+    (textos para el embedder, pares pregunta/pasaje para el reranker).
+
+    Cada request se encola con su propio future; un worker toma el primero,
+    espera hasta `max_wait_ms` (o hasta juntar `max_batch_size` textos),
+    ejecuta un solo `encode` y reparte las filas a cada llamador.
+    """
+
+    def __init__(
+        self,
+        encode_fn: Callable[[list[str]], np.ndarray],
+        max_batch_size: int = BATCH_MAX_SIZE,
+        max_wait_ms: float = BATCH_MAX_WAIT_MS,
+    ):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        # Un solo hilo: el modelo ya paraleliza internamente, encodes simultáneos compiten por CPU
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embedding-batcher")
+
+    async def start(self):
+        if self._worker is None:
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        self._executor.shutdown(wait=False)
+
+    async def submit(self, texts: list[str]) -> np.ndarray:
+        """Encola los textos y espera sus embeddings"""
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        if self._worker is None or self._worker.done():
+            raise RuntimeError("EmbeddingBatcher no iniciado")
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((texts, future))
+        return await future
+
+    async def _collect(self, batch: list):
+        """Toma el primer request y completa el batch hasta el tamaño o timeout"""
+        batch.append(await self._queue.get())
+        size = len(batch[0][0])
+        deadline = time.monotonic() + self.max_wait
+
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    item = self._queue.get_nowait()
+                else:
+                    item = await asyncio.wait_for(self._queue.get(), timeout=remaining)
+            except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                break
+            batch.append(item)
+            size += len(item[0])
+
+    @staticmethod
+    def _fail(batch: list, error: BaseException):
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(error)
+
+    async def _encode(self, loop: asyncio.AbstractEventLoop, batch: list):
+        # Descartar requests cuyo cliente ya se fue
+        batch = [(texts, future) for texts, future in batch if not future.done()]
+        if not batch:
+            return
+
+        all_texts = [text for texts, _ in batch for text in texts]
+        embeddings = await loop.run_in_executor(self._executor, self.encode_fn, all_texts)
+        if len(embeddings) != len(all_texts):
+            raise ValueError(f"El modelo devolvió {len(embeddings)} filas para {len(all_texts)} textos")
+
+        offset = 0
+        for texts, future in batch:
+            end = offset + len(texts)
+            if not future.done():
+                future.set_result(embeddings[offset:end])
+            offset = end
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        batch = []
+        try:
+            while True:
+                batch = []
+                try:
+                    await self._collect(batch)
+                    await self._encode(loop, batch)
+                except Exception as e:
+                    # Cualquier error del lote se entrega a sus llamadores; el worker sigue vivo
+                    self._fail(batch, e)
+        finally:
+            # Al detenerse el worker no queda ningún llamador esperando para siempre
+            pending = batch
+            while not self._queue.empty():
+                pending.append(self._queue.get_nowait())
+            self._fail(pending, RuntimeError("EmbeddingBatcher detenido"))
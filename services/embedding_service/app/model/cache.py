@@ -0,0 +1,216 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, Optional
+
+import numpy as np
+
+EMBEDDING_CACHE_MEMORY_ITEMS = int(os.getenv("EMBEDDING_CACHE_MEMORY_ITEMS", 10000))
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "/opt/embedding_service/cache/embeddings.sqlite")
+EMBEDDING_CACHE_DISK_MAX_ITEMS = int(os.getenv("EMBEDDING_CACHE_DISK_MAX_ITEMS", 500000))
+
+
+def normalize_text(text: str) -> str:
+    """Normaliza unicode y espacios para que variantes triviales compartan entrada"""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class EmbeddingCache:
+    """
+    Cache de embeddings direccionado por contenido: sha256(modelo + texto normalizado).
+
+    Dos niveles: LRU en memoria del proceso y un SQLite en disco que sobrevive
+    reinicios. Ambos se acotan por cantidad de entradas.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        memory_items: int = EMBEDDING_CACHE_MEMORY_ITEMS,
+        path: Optional[str] = EMBEDDING_CACHE_PATH,
+        disk_max_items: int = EMBEDDING_CACHE_DISK_MAX_ITEMS,
+    ):
+        self.model_name = model_name
+        self.memory_items = memory_items
+        self.disk_max_items = disk_max_items
+        self._memory: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._disk_count = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if path:
+            try:
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute("PRAGMA synchronous=NORMAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS embeddings ("
+                    "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_access REAL NOT NULL)"
+                )
+                self._db.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON embeddings(last_access)")
+                self._disk_count = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            except Exception as e:
+                print(f"Advertencia: cache de embeddings en disco deshabilitado: {e}")
+                self._db = None
+
+    def _key(self, text: str) -> str:
+        raw = f"{self.model_name}\0{normalize_text(text)}"
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def _memory_get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+            return vector
+
+    def _memory_put(self, key: str, vector: np.ndarray):
+        if self.memory_items <= 0:
+            return
+        with self._lock:
+            self._memory[key] = vector
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+
+    def _disk_get(self, keys: list[str]) -> dict[str, np.ndarray]:
+        if self._db is None or not keys:
+            return {}
+        found = {}
+        with self._disk_lock:
+            # SQLite limita la cantidad de parámetros por sentencia
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._db.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+                if rows:
+                    self._db.execute(
+                        f"UPDATE embeddings SET last_access = ? WHERE key IN ({','.join('?' * len(rows))})",
+                        [time.time(), *[key for key, _ in rows]],
+                    )
+        return found
+
+    def _count_existing(self, keys: list[str]) -> int:
+        count = 0
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            count += self._db.execute(
+                f"SELECT COUNT(*) FROM embeddings WHERE key IN ({placeholders})", chunk
+            ).fetchone()[0]
+        return count
+
+    def _disk_put(self, items: list[tuple[str, np.ndarray]]):
+        if self._db is None or not items:
+            return
+        now = time.time()
+        items = dict(items)
+        with self._disk_lock:
+            self._db.execute("BEGIN")
+            try:
+                # El REPLACE de una clave existente no agrega filas: solo se cuentan las nuevas
+                existing = self._count_existing(list(items))
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector, last_access) VALUES (?, ?, ?)",
+                    [(key, np.asarray(vector, dtype=np.float32).tobytes(), now) for key, vector in items.items()],
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                # Sin el ROLLBACK la conexión queda dentro de la transacción y todo BEGIN posterior falla
+                self._db.execute("ROLLBACK")
+                raise
+            self._disk_count += len(items) - existing
+            if self._disk_count > self.disk_max_items:
+                self._evict_disk()
+
+    def _evict_disk(self):
+        """Elimina las entradas menos accedidas hasta quedar en el 90% del límite"""
+        self._disk_count = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        excess = self._disk_count - int(self.disk_max_items * 0.9)
+        if excess > 0:
+            self._db.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY last_access ASC LIMIT ?)",
+                (excess,),
+            )
+            self._disk_count -= excess
+
+    def get_many(self, texts: list[str], memory_only: bool = False) -> list[Optional[np.ndarray]]:
+        """Devuelve el embedding cacheado de cada texto, o None si no está"""
+        keys = [self._key(text) for text in texts]
+        results = [self._memory_get(key) for key in keys]
+        memory_hits = sum(vector is not None for vector in results)
+
+        if memory_only:
+            # Solo se contabiliza si el fast-path resuelve todo; si no, lo cuenta el encode posterior
+            if memory_hits == len(texts):
+                with self._lock:
+                    self.memory_hits += memory_hits
+            return results
+
+        missing = [key for key, vector in zip(keys, results) if vector is None]
+        from_disk = self._disk_get(list(dict.fromkeys(missing)))
+        for i, key in enumerate(keys):
+            if results[i] is None and key in from_disk:
+                results[i] = from_disk[key]
+                self._memory_put(key, from_disk[key])
+
+        disk_hits = sum(key in from_disk for key in missing)
+        with self._lock:
+            self.memory_hits += memory_hits
+            self.disk_hits += disk_hits
+            self.misses += len(texts) - memory_hits - disk_hits
+        return results
+
+    def put_many(self, texts: list[str], vectors: np.ndarray):
+        items = []
+        for text, vector in zip(texts, vectors):
+            key = self._key(text)
+            vector = np.asarray(vector, dtype=np.float32)
+            self._memory_put(key, vector)
+            items.append((key, vector))
+        try:
+            self._disk_put(items)
+        except Exception as e:
+            print(f"Error guardando embeddings en disco: {e}")
+
+    def encode(self, texts: list[str], encode_fn: Callable[[list[str]], np.ndarray]) -> np.ndarray:
+        """Resuelve desde el cache y solo pasa por el modelo los textos faltantes"""
+        vectors = self.get_many(texts)
+        # Deduplicar por clave: textos que solo difieren en espacios se codifican una vez
+        missing = {}
+        for text, vector in zip(texts, vectors):
+            if vector is None:
+                missing.setdefault(self._key(text), text)
+        if missing:
+            encoded = encode_fn(list(missing.values()))
+            self.put_many(list(missing.values()), encoded)
+            by_key = dict(zip(missing.keys(), encoded))
+            vectors = [by_key[self._key(text)] if vector is None else vector for text, vector in zip(texts, vectors)]
+        return np.stack([np.asarray(vector, dtype=np.float32) for vector in vectors])
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "model": self.model_name,
+                "memory_items": len(self._memory),
+                "disk_items": self._disk_count if self._db is not None else None,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,41 @@
+import struct
+from typing import Optional
+
+import numpy as np
+
+# Formato binario de embeddings:
+#   header (12 bytes, little-endian): magic b"EMB" | dtype (b"f"=float32, b"e"=float16) | filas uint32 | dim uint32
+#   cuerpo: matriz row-major en el dtype indicado, little-endian
+MAGIC = b"EMB"
+HEADER = struct.Struct("<3scII")
+
+MEDIA_TYPE_F32 = "application/x-embedding-f32"
+MEDIA_TYPE_F16 = "application/x-embedding-f16"
+
+_DTYPES = {
+    MEDIA_TYPE_F32: (b"f", np.dtype("<f4")),
+    MEDIA_TYPE_F16: (b"e", np.dtype("<f2")),
+}
+
+
+def negotiate_media_type(accept: Optional[str]) -> Optional[str]:
+    """Devuelve el media type binario pedido en Accept, o None para JSON"""
+    if not accept:
+        return None
+    for part in accept.split(","):
+        media_type = part.split(";")[0].strip().lower()
+        if media_type in _DTYPES:
+            return media_type
+        if media_type == "application/octet-stream":
+            return MEDIA_TYPE_F32
+    return None
+
+
+def encode_embeddings(embeddings: np.ndarray, media_type: str) -> bytes:
+    """Serializa la matriz de embeddings con su header de forma"""
+    code, dtype = _DTYPES[media_type]
+    matrix = np.ascontiguousarray(embeddings, dtype=dtype)
+    if matrix.ndim != 2:
+        matrix = matrix.reshape(len(matrix), -1)
+    rows, dim = matrix.shape
+    return HEADER.pack(MAGIC, code, rows, dim) + matrix.tobytes()
@@ -1,9 +1,83 @@
+import os
+
+import numpy as np
 from sentence_transformers import SentenceTransformer
 
 
-model = SentenceTransformer("sentence-transformers/all-mpnet-base-v2")
+MODEL_NAME = "sentence-transformers/all-mpnet-base-v2"
+
+# "torch" (eager fp32), "onnx" (ONNX Runtime fp32) u "onnx-int8" (ONNX Runtime con cuantización dinámica int8)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+# Set de instrucciones para la cuantización int8: avx2, avx512, avx512_vnni o arm64
+EMBEDDING_ONNX_QUANTIZATION = os.getenv("EMBEDDING_ONNX_QUANTIZATION", "avx2")
+# Donde se guarda el modelo cuantizado (en el volumen del cache para no re-exportar en cada arranque)
+EMBEDDING_ONNX_DIR = os.getenv("EMBEDDING_ONNX_DIR", "/opt/embedding_service/cache/onnx")
+# Threads de inferencia (0 = default de la librería, todos los cores)
+EMBEDDING_NUM_THREADS = int(os.getenv("EMBEDDING_NUM_THREADS", 0))
+EMBEDDING_ENCODE_BATCH_SIZE = int(os.getenv("EMBEDDING_ENCODE_BATCH_SIZE", 32))
+
+# Los vectores int8 difieren levemente de los fp32: cada backend tiene su propio espacio en el cache
+CACHE_MODEL_ID = MODEL_NAME if EMBEDDING_BACKEND == "torch" else f"{MODEL_NAME}@{EMBEDDING_BACKEND}"
+
+
+def _onnx_model_kwargs() -> dict:
+    kwargs = {"provider": "CPUExecutionProvider"}
+    if EMBEDDING_NUM_THREADS > 0:
+        import onnxruntime
+
+        session_options = onnxruntime.SessionOptions()
+        session_options.intra_op_num_threads = EMBEDDING_NUM_THREADS
+        session_options.inter_op_num_threads = 1
+        kwargs["session_options"] = session_options
+    return kwargs
+
+
+def _load_int8_model() -> SentenceTransformer:
+    """Exporta (una sola vez) el modelo a ONNX con cuantización dinámica int8 y lo carga"""
+    from sentence_transformers import export_dynamic_quantized_onnx_model
+
+    model_dir = os.path.join(EMBEDDING_ONNX_DIR, MODEL_NAME.replace("/", "__"))
+    file_name = f"onnx/model_int8_{EMBEDDING_ONNX_QUANTIZATION}.onnx"
+    if not os.path.exists(os.path.join(model_dir, file_name)):
+        print(f"⚙️ Exportando {MODEL_NAME} a ONNX int8 ({EMBEDDING_ONNX_QUANTIZATION}) en {model_dir}")
+        fp32 = SentenceTransformer(MODEL_NAME, backend="onnx", device="cpu")
+        fp32.save(model_dir)
+        export_dynamic_quantized_onnx_model(
+            fp32, EMBEDDING_ONNX_QUANTIZATION, model_dir, file_suffix=f"int8_{EMBEDDING_ONNX_QUANTIZATION}"
+        )
+    return SentenceTransformer(
+        model_dir, backend="onnx", device="cpu", model_kwargs={**_onnx_model_kwargs(), "file_name": file_name}
+    )
+
+
+def load_model(backend: str = EMBEDDING_BACKEND) -> SentenceTransformer:
+    if backend == "onnx":
+        return SentenceTransformer(MODEL_NAME, backend="onnx", device="cpu", model_kwargs=_onnx_model_kwargs())
+    if backend == "onnx-int8":
+        return _load_int8_model()
+    if backend != "torch":
+        raise ValueError(f"EMBEDDING_BACKEND desconocido: {backend}")
+    if EMBEDDING_NUM_THREADS > 0:
+        import torch
+
+        torch.set_num_threads(EMBEDDING_NUM_THREADS)
+    return SentenceTransformer(MODEL_NAME, device="cpu")
+
+
+model = load_model()
+
+
+def encode_texts(texts: list[str], encoder: SentenceTransformer = None) -> np.ndarray:
+    """
+    Codifica los textos y devuelve la matriz de embeddings (n, 768).
+
+    `encode` ya ordena los textos por largo antes de partirlos en batches (menos
+    padding) y devuelve los vectores en el orden original.
+    """
+    encoder = model if encoder is None else encoder
+    return encoder.encode(texts, batch_size=EMBEDDING_ENCODE_BATCH_SIZE, convert_to_numpy=True)
 
 
 def get_embeddings(texts: list[str]):
-    embedding = model.encode(texts, convert_to_numpy= True).tolist()
+    embedding = encode_texts(texts).tolist()
     return embedding
@@ -0,0 +1,64 @@
+"""
+Chequeo de paridad entre el backend de embeddings configurado y PyTorch fp32.
+
+Uso (dentro del contenedor):
+    EMBEDDING_BACKEND=onnx-int8 python -m app.model.parity
+
+Compara la similitud coseno fila a fila entre ambos backends y termina con
+código 1 si alguna queda por debajo de EMBEDDING_PARITY_MIN_COSINE.
+"""
+import os
+import sys
+import time
+from typing import Optional
+
+import numpy as np
+
+from app.model.embedder import EMBEDDING_BACKEND, encode_texts, load_model, model
+
+EMBEDDING_PARITY_MIN_COSINE = float(os.getenv("EMBEDDING_PARITY_MIN_COSINE", 0.99))
+
+SAMPLE_TEXTS = [
+    "hola",
+    "¿Cómo genero un nuevo token de seguridad?",
+    "Dirigite a un cajero automático Banelco con tu tarjeta de débito y elegí la opción generación de claves.",
+    "¿Cuál es la tasa de interés de un plazo fijo a 30 días?",
+    "Cambié de celular y la app Macro no me deja activar el token.",
+    "Banco Macro S.A. - Términos y condiciones de la cuenta sueldo. "
+    "El titular podrá solicitar la tarjeta de débito en cualquier sucursal del banco. " * 6,
+]
+
+
+def cosine_parity(texts: list[str], candidate=None, reference=None) -> np.ndarray:
+    """Similitud coseno fila a fila entre los embeddings de `candidate` y `reference` (PyTorch fp32)"""
+    candidate = model if candidate is None else candidate
+    reference = load_model("torch") if reference is None else reference
+    a = encode_texts(texts, candidate)
+    b = encode_texts(texts, reference)
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True)
+    return np.sum(a * b, axis=1)
+
+
+def _timed(encoder, texts: list[str], rounds: int = 5) -> float:
+    encode_texts(texts, encoder)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        encode_texts(texts, encoder)
+    return (time.perf_counter() - start) / rounds
+
+
+def main(texts: Optional[list[str]] = None) -> int:
+    texts = texts or SAMPLE_TEXTS
+    reference = load_model("torch")
+    similarities = cosine_parity(texts, model, reference)
+    print(f"Backend: {EMBEDDING_BACKEND} vs torch fp32")
+    for text, similarity in zip(texts, similarities):
+        print(f"  {similarity:.5f}  {text[:60]}")
+    print(f"Mínimo {similarities.min():.5f} / medio {similarities.mean():.5f} (umbral {EMBEDDING_PARITY_MIN_COSINE})")
+    print(f"Latencia por batch: {_timed(model, texts) * 1000:.1f} ms vs {_timed(reference, texts) * 1000:.1f} ms (torch)")
+    return 0 if similarities.min() >= EMBEDDING_PARITY_MIN_COSINE else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,51 @@
+import os
+import threading
+from typing import Optional
+
+import numpy as np
+from sentence_transformers import CrossEncoder
+
+# Cross-encoder multilingüe chico (MiniLM, 12 capas, 384 dims): los documentos están en español
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
+# "torch" (eager fp32) u "onnx" (ONNX Runtime; con RERANK_ONNX_FILE se puede elegir un export int8)
+RERANK_BACKEND = os.getenv("RERANK_BACKEND", "torch")
+RERANK_ONNX_FILE = os.getenv("RERANK_ONNX_FILE", "")
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", 32))
+RERANK_MAX_LENGTH = int(os.getenv("RERANK_MAX_LENGTH", 512))
+
+_model: Optional[CrossEncoder] = None
+_lock = threading.Lock()
+
+
+def load_reranker() -> CrossEncoder:
+    """Carga el cross-encoder una sola vez (en el arranque del servicio o en el primer /rerank)"""
+    global _model
+    with _lock:
+        if _model is None:
+            kwargs = {"max_length": RERANK_MAX_LENGTH, "device": "cpu"}
+            if RERANK_BACKEND == "onnx":
+                kwargs["backend"] = "onnx"
+                if RERANK_ONNX_FILE:
+                    kwargs["model_kwargs"] = {"file_name": RERANK_ONNX_FILE}
+            _model = CrossEncoder(RERANK_MODEL, **kwargs)
+        return _model
+
+
+def reranker_loaded() -> bool:
+    return _model is not None
+
+
+def score_pairs(pairs: list[tuple[str, str]]) -> np.ndarray:
+    """Puntaje de relevancia de cada par (pregunta, pasaje), en batches de RERANK_BATCH_SIZE"""
+    model = load_reranker()
+    # Ordenar por largo reduce el padding dentro de cada batch; se devuelve en el orden original
+    order = np.argsort([len(query) + len(passage) for query, passage in pairs])
+    scores = model.predict(
+        [pairs[i] for i in order],
+        batch_size=RERANK_BATCH_SIZE,
+        convert_to_numpy=True,
+        show_progress_bar=False,
+    )
+    result = np.empty(len(pairs), dtype=np.float32)
+    result[order] = scores
+    return result
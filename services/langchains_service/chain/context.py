@@ -0,0 +1,129 @@
+import os
+import re
+from functools import lru_cache
+from typing import List, Optional
+
+from models.bm25 import tokenize
+
+# Presupuesto de tokens para los documentos del prompt (el prefill en CPU escala con el largo)
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", 1500))
+# Tokenizer del modelo servido por Ollama: repo de Hugging Face o ruta a un tokenizer.json (vacío = estimar)
+CONTEXT_TOKENIZER = os.getenv("CONTEXT_TOKENIZER", "unsloth/Llama-3.2-3B-Instruct")
+# Peso de la relevancia frente a la diversidad en MMR
+CONTEXT_MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", 0.7))
+# Fracción de shingles ya presentes en el contexto a partir de la cual un pasaje se descarta
+CONTEXT_DUPLICATE_THRESHOLD = float(os.getenv("CONTEXT_DUPLICATE_THRESHOLD", 0.8))
+# Por debajo de este remanente no vale la pena recortar un pasaje más
+CONTEXT_MIN_PASSAGE_TOKENS = 40
+
+SEPARATOR = "\n\n---\n\n"
+SHINGLE_SIZE = 3
+
+# Oraciones: hasta un signo de cierre o un salto de línea
+_SENTENCE_RE = re.compile(r"[^.!?\n]+(?:[.!?]+|\n|$)")
+
+
+@lru_cache(maxsize=1)
+def _get_tokenizer():
+    if not CONTEXT_TOKENIZER:
+        return None
+    try:
+        from tokenizers import Tokenizer
+        if os.path.isfile(CONTEXT_TOKENIZER):
+            return Tokenizer.from_file(CONTEXT_TOKENIZER)
+        return Tokenizer.from_pretrained(CONTEXT_TOKENIZER)
+    except Exception as e:
+        print(f"Advertencia: no se pudo cargar el tokenizer {CONTEXT_TOKENIZER}, se estima por caracteres: {e}")
+        return None
+
+
+def load_tokenizer():
+    """Carga el tokenizer por adelantado (la primera carga puede descargarlo)"""
+    _get_tokenizer()
+
+
+def count_tokens(text: str) -> int:
+    tokenizer = _get_tokenizer()
+    if tokenizer is None:
+        # ~3 caracteres por token en español con el vocabulario de Llama 3
+        return len(text) // 3 + 1
+    return len(tokenizer.encode(text, add_special_tokens=False).ids)
+
+
+def _shingles(terms: List[str]) -> set:
+    if len(terms) < SHINGLE_SIZE:
+        return {tuple(terms)} if terms else set()
+    return {tuple(terms[i:i + SHINGLE_SIZE]) for i in range(len(terms) - SHINGLE_SIZE + 1)}
+
+
+def _jaccard(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _fit_sentences(text: str, max_tokens: int) -> Optional[str]:
+    """Prefijo del texto con las oraciones completas que entran en `max_tokens`"""
+    end = 0
+    used = 0
+    for match in _SENTENCE_RE.finditer(text):
+        cost = count_tokens(match.group())
+        if used + cost > max_tokens:
+            break
+        used += cost
+        end = match.end()
+    fitted = text[:end].strip()
+    return fitted or None
+
+
+def build_context(texts: List[str], max_tokens: int = CONTEXT_MAX_TOKENS) -> List[str]:
+    """
+    Elige y recorta los pasajes del contexto dentro de un presupuesto de tokens.
+
+    `texts` llega ordenado por relevancia (orden del retrieval). Los pasajes se
+    eligen por maximal marginal relevance, se descartan los casi duplicados de
+    lo ya elegido (contención de shingles) y el último que no entra completo se
+    recorta en un límite de oración.
+    """
+    texts = [text.strip() for text in texts if text and text.strip()]
+    if not texts:
+        return []
+
+    terms = [tokenize(text) for text in texts]
+    term_sets = [set(t) for t in terms]
+    shingles = [_shingles(t) for t in terms]
+    relevance = [1 - i / len(texts) for i in range(len(texts))]
+
+    selected: List[int] = []
+    context_shingles: set = set()
+    remaining = list(range(len(texts)))
+    parts: List[str] = []
+    budget = max_tokens
+    separator_tokens = count_tokens(SEPARATOR)
+
+    while remaining and budget >= CONTEXT_MIN_PASSAGE_TOKENS:
+        def mmr(i: int) -> float:
+            redundancy = max((_jaccard(term_sets[i], term_sets[j]) for j in selected), default=0.0)
+            return CONTEXT_MMR_LAMBDA * relevance[i] - (1 - CONTEXT_MMR_LAMBDA) * redundancy
+
+        best = max(remaining, key=mmr)
+        remaining.remove(best)
+
+        if shingles[best] and len(shingles[best] & context_shingles) / len(shingles[best]) >= CONTEXT_DUPLICATE_THRESHOLD:
+            continue
+
+        cost = count_tokens(texts[best]) + (separator_tokens if parts else 0)
+        if cost <= budget:
+            passage = texts[best]
+        else:
+            passage = _fit_sentences(texts[best], budget - (separator_tokens if parts else 0))
+            if passage is None:
+                continue
+            cost = count_tokens(passage) + (separator_tokens if parts else 0)
+
+        parts.append(passage)
+        selected.append(best)
+        context_shingles |= shingles[best]
+        budget -= cost
+
+    return parts
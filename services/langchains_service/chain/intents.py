@@ -0,0 +1,260 @@
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Iterable, Optional
+
+# Consultas de búsqueda canónicas
+QUERY_CAJERO = "Dirigite cajero automatico banelco tarjeta debito claves generacion token"
+QUERY_TOKEN = "token seguridad cajero generacion claves activacion"
+QUERY_TASA = "tasa interes deposito plazo fijo"
+
+DEFAULT_K = 8
+
+
+class KeywordMatcher:
+    """
+    Matcher de palabras clave compilado en una única regex.
+
+    `match` recorre el texto una sola vez y devuelve todos los grupos con al
+    menos una palabra clave presente (coincidencia por substring, igual que
+    `palabra in texto`). La regex usa un lookahead para reportar coincidencias
+    solapadas; como en cada posición gana la palabra más larga, cada palabra
+    hereda los grupos de las palabras que son prefijo suyo.
+    """
+
+    def __init__(self, groups: dict[str, Iterable[str]]):
+        by_keyword: dict[str, set[str]] = {}
+        for group, keywords in groups.items():
+            for keyword in keywords:
+                by_keyword.setdefault(keyword.lower(), set()).add(group)
+
+        keywords = sorted(by_keyword, key=len, reverse=True)
+        self._groups = {
+            keyword: frozenset().union(*(by_keyword[other] for other in by_keyword if keyword.startswith(other)))
+            for keyword in keywords
+        }
+        self._pattern = re.compile("(?=(" + "|".join(map(re.escape, keywords)) + "))") if keywords else None
+
+    def match(self, text_lower: str) -> set[str]:
+        found: set[str] = set()
+        if self._pattern is None:
+            return found
+        for m in self._pattern.finditer(text_lower):
+            found |= self._groups[m.group(1)]
+        return found
+
+
+@dataclass(frozen=True)
+class Intent:
+    """
+    Regla declarativa de intención.
+
+    keywords: activan la intención si aparecen en la pregunta
+    exact: activan la intención si son la pregunta completa
+    requires / excludes: otras intenciones que deben (o no deben) estar presentes
+    answer: respuesta directa sin retrieval ni LLM
+    search_query / k: consulta de búsqueda y cantidad de documentos
+    history_topics: si hay contexto histórico, (palabras, consulta) para reescribir la búsqueda
+    prompt: clave de la plantilla en chain.prompts.PROMPTS
+    doc_filter: tema de los documentos a recuperar (etiqueta `topics` del chunk, ver DOC_FILTERS)
+    """
+
+    name: str
+    keywords: tuple[str, ...] = ()
+    exact: tuple[str, ...] = ()
+    requires: tuple[str, ...] = ()
+    excludes: tuple[str, ...] = ()
+    answer: Optional[str] = None
+    search_query: Optional[str] = None
+    k: Optional[int] = None
+    history_topics: tuple[tuple[tuple[str, ...], str], ...] = ()
+    prompt: Optional[str] = None
+    doc_filter: Optional[str] = None
+
+
+# El orden define la prioridad cuando varias intenciones aportan el mismo campo
+INTENTS: tuple[Intent, ...] = (
+    Intent(
+        "saludo",
+        exact=("hola", "hola, como estas", "como estas", "buenos días", "buenas tardes", "buenas noches", "hi", "hello"),
+        answer="Hola, ¿en qué puedo ayudarte?",
+    ),
+    Intent(
+        "fuera_de_contexto",
+        keywords=("podes buscar en internet", "puedes buscar en internet", "buscar en internet", "busca en google"),
+        answer="No, no puedo buscar en internet. Solo puedo responder con la información disponible en los documentos del banco.",
+    ),
+    Intent("banco", keywords=("banco", "macro")),
+    Intent(
+        "agente",
+        keywords=("agente",),
+        requires=("banco",),
+        answer="Sí, soy un asistente virtual del Banco Macro. ¿En qué puedo ayudarte?",
+    ),
+    Intent(
+        "cajero",
+        keywords=("cajero", "quiero ir", "ir al cajero", "cajero automatico", "cajero automático", "banelco"),
+        search_query=QUERY_CAJERO,
+        # Qdrant devuelve solo chunks etiquetados "cajero": no hace falta traer de más para descartar
+        k=6,
+        prompt="cajero",
+        doc_filter="cajero",
+    ),
+    Intent(
+        "token",
+        keywords=("token", "trabo", "traba", "bloqueado", "no funciona", "no responde", "problema con", "arreglar",
+                  "generar", "nuevo token", "crear token", "activar token"),
+        search_query=QUERY_TOKEN,
+    ),
+    Intent(
+        "cambio_dispositivo",
+        keywords=("cambie", "cambio", "cambiar", "nuevo celular", "nuevo dispositivo", "otro celular", "otro dispositivo"),
+        requires=("token",),
+        search_query=QUERY_TOKEN,
+    ),
+    Intent(
+        "vaga",
+        keywords=("me podes guiar", "me guias", "como hago", "podes ayudarme", "ayudame", "guia", "instrucciones"),
+        search_query=QUERY_TOKEN,
+        history_topics=((("token", "trabo"), QUERY_TOKEN), (("tasa", "interes"), QUERY_TASA)),
+    ),
+    Intent(
+        "general",
+        keywords=("qué es", "que es", "como funciona", "cómo funciona", "para que", "para qué", "definicion", "definición"),
+        prompt="general",
+    ),
+    Intent(
+        "accion_token",
+        keywords=("generar", "nuevo token", "crear token", "activar token", "vencio", "venció", "como genero",
+                  "como activo", "como creo"),
+        excludes=("general",),
+        doc_filter="token",
+    ),
+)
+
+_QUESTION_MATCHER = KeywordMatcher({intent.name: intent.keywords for intent in INTENTS})
+_EXACT = {phrase: intent.name for intent in INTENTS for phrase in intent.exact}
+_HISTORY_MATCHERS = {
+    intent.name: KeywordMatcher({query: words for words, query in intent.history_topics})
+    for intent in INTENTS
+    if intent.history_topics
+}
+
+
+@lru_cache(maxsize=4096)
+def detect_intents(question_lower: str) -> frozenset[str]:
+    """Todas las intenciones activas de la pregunta (ya normalizada) en una sola pasada"""
+    matched = _QUESTION_MATCHER.match(question_lower)
+    if question_lower in _EXACT:
+        matched.add(_EXACT[question_lower])
+    return frozenset(
+        intent.name
+        for intent in INTENTS
+        if intent.name in matched
+        and all(name in matched for name in intent.requires)
+        and not any(name in matched for name in intent.excludes)
+    )
+
+
+@dataclass(frozen=True)
+class Route:
+    """Resultado de enrutar una pregunta"""
+
+    intents: frozenset[str]
+    name: Optional[str] = None
+    answer: Optional[str] = None
+    search_query: Optional[str] = None
+    k: int = DEFAULT_K
+    prompt: str = "estricto"
+    doc_filter: Optional[str] = None
+
+
+def _first(intents: frozenset[str], field: str) -> Optional[Intent]:
+    for intent in INTENTS:
+        if intent.name in intents and getattr(intent, field):
+            return intent
+    return None
+
+
+def direct_answer(question: str) -> Optional[str]:
+    """Respuesta fija de la primera intención que la define, si hay alguna"""
+    direct = _first(detect_intents(question.lower().strip()), "answer")
+    return direct.answer if direct is not None else None
+
+
+def route_question(question: str, context_historico: str = "") -> Route:
+    """Enruta la pregunta según la tabla de intenciones"""
+    question_lower = question.lower().strip()
+    intents = detect_intents(question_lower)
+
+    direct = _first(intents, "answer")
+    if direct is not None:
+        return Route(intents=intents, answer=direct.answer)
+
+    search_query = question
+    routed = _first(intents, "search_query")
+    if routed is not None:
+        search_query = routed.search_query
+        if routed.history_topics and context_historico:
+            # Pregunta vaga con contexto: buscar según el tema anterior
+            history_lower = context_historico.lower()
+            topics = _HISTORY_MATCHERS[routed.name].match(history_lower)
+            topic_query = next((query for _, query in routed.history_topics if query in topics), None)
+            search_query = topic_query or question + " " + " ".join(history_lower.split()[:10])
+
+    sized = _first(intents, "k")
+    prompt = _first(intents, "prompt")
+    doc_filter = _first(intents, "doc_filter")
+    return Route(
+        intents=intents,
+        name=routed.name if routed else None,
+        search_query=search_query,
+        k=sized.k if sized else DEFAULT_K,
+        prompt=prompt.prompt if prompt else "estricto",
+        doc_filter=doc_filter.doc_filter if doc_filter else None,
+    )
+
+
+# Filtros de documentos: una pasada por documento sobre los términos relevantes
+_DOC_TERMS = KeywordMatcher({
+    "dirigite": ("dirigite",),
+    "cajero": ("cajero",),
+    "banelco": ("banelco",),
+    "tarjeta": ("tarjeta", "débito", "debito"),
+    "claves": ("claves", "generación", "generacion"),
+    "token": ("token", "cajero", "generación", "generacion", "clave", "activación", "activacion", "seguridad",
+              "app macro", "banco macro"),
+})
+
+
+def _filtro_cajero(terms: set[str]) -> bool:
+    # Documentos que describen el proceso en el cajero automático
+    return "cajero" in terms and (
+        "dirigite" in terms or "banelco" in terms or ("tarjeta" in terms and "claves" in terms)
+    )
+
+
+def _filtro_token(terms: set[str]) -> bool:
+    return "token" in terms
+
+
+# Temas de documentos: el DAG de ingesta etiqueta cada chunk con los temas cuyo filtro pasa
+# (payload `topics`, indexado) y el retrieval filtra en Qdrant. Las mismas reglas se aplican
+# en Python solo a chunks ingestados antes de que existieran las etiquetas. La copia del DAG
+# se compara con `python -m models.ingest_parity`.
+DOC_FILTERS = {
+    "cajero": _filtro_cajero,
+    "token": _filtro_token,
+}
+
+
+def doc_topics(text: str) -> list[str]:
+    """Temas de un chunk (misma regla que usa el DAG de ingesta para etiquetarlo)"""
+    terms = _DOC_TERMS.match(text.lower())
+    return [topic for topic, passes in DOC_FILTERS.items() if passes(terms)]
+
+
+def doc_passes_filter(doc_filter: Optional[str], text_lower: str) -> bool:
+    if doc_filter is None:
+        return True
+    return DOC_FILTERS[doc_filter](_DOC_TERMS.match(text_lower))
@@ -0,0 +1,63 @@
+import asyncio
+import os
+from typing import Optional, Union
+
+import httpx
+from langchain_ollama.llms import OllamaLLM
+
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://llm_service:11434")
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3.2:3b")
+
+
+def _keep_alive(value: str) -> Union[int, str]:
+    # Ollama acepta segundos (-1 = no descargar nunca) o una duración como "24h"
+    return int(value) if value.lstrip("-").isdigit() else value
+
+
+def _optional_int(name: str) -> Optional[int]:
+    value = os.getenv(name)
+    return int(value) if value else None
+
+
+OLLAMA_KEEP_ALIVE = _keep_alive(os.getenv("OLLAMA_KEEP_ALIVE", "-1"))
+# Todas las llamadas usan las mismas opciones: si num_ctx cambia, Ollama recarga el modelo
+OLLAMA_NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX", 4096))
+OLLAMA_NUM_PREDICT = int(os.getenv("OLLAMA_NUM_PREDICT", 512))
+OLLAMA_NUM_THREAD = _optional_int("OLLAMA_NUM_THREAD")
+OLLAMA_PRELOAD_RETRIES = 10
+OLLAMA_PRELOAD_DELAY = 5
+
+llm = OllamaLLM(
+    model=OLLAMA_MODEL,
+    base_url=OLLAMA_URL,
+    keep_alive=OLLAMA_KEEP_ALIVE,
+    num_ctx=OLLAMA_NUM_CTX,
+    num_predict=OLLAMA_NUM_PREDICT,
+    num_thread=OLLAMA_NUM_THREAD,
+)
+
+
+def _options() -> dict:
+    options = {"num_ctx": OLLAMA_NUM_CTX}
+    if OLLAMA_NUM_THREAD:
+        options["num_thread"] = OLLAMA_NUM_THREAD
+    return options
+
+
+async def preload_llm():
+    """
+    Carga el modelo en Ollama y lo deja residente (keep_alive) antes del primer request.
+
+    Un generate sin prompt solo carga el modelo; se reintenta mientras llm_service arranca.
+    """
+    payload = {"model": OLLAMA_MODEL, "keep_alive": OLLAMA_KEEP_ALIVE, "options": _options()}
+    async with httpx.AsyncClient(base_url=OLLAMA_URL, timeout=300) as client:
+        for attempt in range(OLLAMA_PRELOAD_RETRIES):
+            try:
+                response = await client.post("/api/generate", json=payload)
+                response.raise_for_status()
+                print(f"🔥 Modelo {OLLAMA_MODEL} cargado en Ollama (keep_alive={OLLAMA_KEEP_ALIVE})")
+                return
+            except Exception as e:
+                print(f"Error precargando {OLLAMA_MODEL} (intento {attempt + 1}/{OLLAMA_PRELOAD_RETRIES}): {e}")
+                await asyncio.sleep(OLLAMA_PRELOAD_DELAY)
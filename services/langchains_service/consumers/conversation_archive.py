@@ -0,0 +1,232 @@
+import asyncio
+import os
+import time
+import uuid
+from collections import deque
+from typing import List, Optional
+
+from qdrant_client import models as qmodels
+from models.qdrant_collections import aensure_collection
+from models.qdrant_schemas import CONVERSATIONS_COLLECTION, _get_async_client, _get_embedding_function
+from models.redis_cache import async_redis_cache
+
+CONVERSATION_ARCHIVE_ENABLED = os.getenv("CONVERSATION_ARCHIVE_ENABLED", "true").lower() == "true"
+CONVERSATION_ARCHIVE_STREAM = os.getenv("CONVERSATION_ARCHIVE_STREAM", "stream:conversations")
+CONVERSATION_ARCHIVE_BATCH_SIZE = int(os.getenv("CONVERSATION_ARCHIVE_BATCH_SIZE", 64))
+CONVERSATION_ARCHIVE_FLUSH_INTERVAL = float(os.getenv("CONVERSATION_ARCHIVE_FLUSH_INTERVAL", 2.0))
+CONVERSATION_ARCHIVE_MAXLEN = int(os.getenv("CONVERSATION_ARCHIVE_MAXLEN", 100000))
+CONSUMER_GROUP = "conversation-archive"
+# Entradas pendientes de otra réplica que se reclaman si llevan este tiempo sin ack (ms)
+CLAIM_MIN_IDLE_MS = 60000
+RETRY_DELAY = 5
+
+
+class ConversationArchive:
+    """
+    Write-behind de la colección de conversaciones de Qdrant.
+
+    Las interacciones se encolan en un stream de Redis (sobreviven reinicios) y
+    un worker las agrupa en lotes: un solo `aembed_documents` y un solo upsert
+    por lote, cuando se juntan `batch_size` interacciones o pasan
+    `flush_interval` segundos. Las entradas se confirman (XACK) recién después
+    del upsert; si Redis no está disponible se usa un buffer en memoria.
+    """
+
+    def __init__(
+        self,
+        collection: str = CONVERSATIONS_COLLECTION,
+        stream: str = CONVERSATION_ARCHIVE_STREAM,
+        batch_size: int = CONVERSATION_ARCHIVE_BATCH_SIZE,
+        flush_interval: float = CONVERSATION_ARCHIVE_FLUSH_INTERVAL,
+        enabled: bool = CONVERSATION_ARCHIVE_ENABLED,
+    ):
+        self.collection = collection
+        self.stream = stream
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.enabled = enabled
+        self.consumer = os.getenv("HOSTNAME", "langchains")
+        self._memory = deque(maxlen=CONVERSATION_ARCHIVE_MAXLEN)
+        self._task: Optional[asyncio.Task] = None
+        self._ready = False
+        self.archived = 0
+        self.skipped = 0
+        self.errors = 0
+
+    def _entry(self, thread_id: str, question: str, answer: str) -> dict:
+        return {"thread_id": thread_id or "", "question": question, "answer": answer, "timestamp": str(time.time())}
+
+    async def aenqueue(self, thread_id: str, question: str, answer: str):
+        """Encola una interacción; no espera embeddings ni Qdrant"""
+        if not self.enabled:
+            return
+        entry = self._entry(thread_id, question, answer)
+        if async_redis_cache.connected:
+            try:
+                await async_redis_cache.client.xadd(
+                    self.stream, entry, maxlen=CONVERSATION_ARCHIVE_MAXLEN, approximate=True
+                )
+                return
+            except Exception as e:
+                print(f"Error encolando la conversación en Redis: {e}")
+        self._memory.append(entry)
+
+    async def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Lo que quedó en memoria se escribe antes de apagar; lo del stream lo retoma el próximo arranque
+        try:
+            await self._flush_memory()
+        except Exception as e:
+            print(f"Error archivando conversaciones al apagar: {e}")
+
+    async def _ensure_group(self):
+        try:
+            await async_redis_cache.client.xgroup_create(self.stream, CONSUMER_GROUP, id="0", mkstream=True)
+        except Exception as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def _ensure_collection(self) -> bool:
+        # Como antes del write-behind, solo se archiva si la colección ya existe (no se crea acá)
+        if not self._ready:
+            self._ready = await aensure_collection(_get_async_client(), self.collection, create=False)
+        return self._ready
+
+    async def _run(self):
+        # Reintenta mientras Redis o Qdrant no estén disponibles sin afectar al resto del servicio
+        while True:
+            try:
+                if async_redis_cache.connected:
+                    await self._ensure_group()
+                    await self._recover()
+                    await self._consume()
+                else:
+                    await asyncio.sleep(self.flush_interval)
+                    await self._flush_memory()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                print(f"Error en el archivado de conversaciones: {e}. Reintentando en {RETRY_DELAY}s")
+                await asyncio.sleep(RETRY_DELAY)
+
+    async def _recover(self):
+        """Re-procesa las entradas sin ack: las propias (reinicio) y las de réplicas caídas"""
+        client = async_redis_cache.client
+        while True:
+            response = await client.xreadgroup(
+                CONSUMER_GROUP, self.consumer, {self.stream: "0"}, count=self.batch_size
+            )
+            entries = response[0][1] if response else []
+            if not entries:
+                break
+            await self._archive(entries)
+
+        start = "0-0"
+        while True:
+            start, entries, *_ = await client.xautoclaim(
+                self.stream, CONSUMER_GROUP, self.consumer, CLAIM_MIN_IDLE_MS, start_id=start, count=self.batch_size
+            )
+            if entries:
+                await self._archive(entries)
+            if start in ("0-0", b"0-0"):
+                break
+
+    async def _consume(self):
+        client = async_redis_cache.client
+        batch = []
+        deadline = None
+        while True:
+            timeout = self.flush_interval if deadline is None else max(0.0, deadline - time.monotonic())
+            response = await client.xreadgroup(
+                CONSUMER_GROUP,
+                self.consumer,
+                {self.stream: ">"},
+                count=self.batch_size - len(batch),
+                block=max(1, int(timeout * 1000)),
+            )
+            if response:
+                batch.extend(response[0][1])
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+            if batch and (len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                await self._archive(batch)
+                batch = []
+                deadline = None
+            if self._memory:
+                await self._flush_memory()
+
+    async def _flush_memory(self):
+        while self._memory:
+            entries = [self._memory.popleft() for _ in range(min(self.batch_size, len(self._memory)))]
+            try:
+                await self._upsert(entries)
+            except Exception:
+                self._memory.extendleft(reversed(entries))
+                raise
+
+    async def _archive(self, entries: list):
+        """Upsert de un lote del stream y ack/borrado de sus entradas"""
+        ids = [entry_id for entry_id, _ in entries]
+        # Entradas vacías (p. ej. borradas por MAXLEN) se confirman sin archivar
+        pending = [(entry_id, data) for entry_id, data in entries if data]
+        if pending:
+            await self._upsert([data for _, data in pending], [entry_id for entry_id, _ in pending])
+        client = async_redis_cache.client
+        pipe = client.pipeline(transaction=False)
+        pipe.xack(self.stream, CONSUMER_GROUP, *ids)
+        pipe.xdel(self.stream, *ids)
+        await pipe.execute()
+
+    def _points(self, entries: List[dict], vectors: List[List[float]], ids: Optional[list]) -> List[qmodels.PointStruct]:
+        points = []
+        for i, entry in enumerate(entries):
+            # Ids deterministas por entrada del stream: re-procesar una entrada sobrescribe sus puntos
+            base = ids[i] if ids else uuid.uuid4().hex
+            metadata = {
+                "thread_id": entry.get("thread_id") or None,
+                "timestamp": float(entry.get("timestamp") or time.time()),
+            }
+            for j, role in enumerate(("question", "answer")):
+                points.append(qmodels.PointStruct(
+                    id=str(uuid.uuid5(uuid.NAMESPACE_URL, f"{self.stream}:{base}:{role}")),
+                    vector=vectors[2 * i + j],
+                    payload={"page_content": entry.get(role, ""), "metadata": {**metadata, "role": role}},
+                ))
+        return points
+
+    async def _upsert(self, entries: List[dict], ids: Optional[list] = None):
+        if not await self._ensure_collection():
+            self.skipped += len(entries)
+            return
+        texts = [text for entry in entries for text in (entry.get("question", ""), entry.get("answer", ""))]
+        vectors = await _get_embedding_function().aembed_documents(texts)
+        await _get_async_client().upsert(
+            collection_name=self.collection,
+            points=self._points(entries, vectors, ids),
+        )
+        self.archived += len(entries)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "collection": self.collection,
+            "stream": self.stream,
+            "archived": self.archived,
+            "skipped": self.skipped,
+            "buffered_in_memory": len(self._memory),
+            "errors": self.errors,
+        }
+
+
+conversation_archive = ConversationArchive()
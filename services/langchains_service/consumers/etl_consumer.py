@@ -0,0 +1,116 @@
+import asyncio
+import json
+import os
+from typing import Optional
+
+from aiokafka import AIOKafkaConsumer
+from chain.rag_chain import awarm_answer
+from models.redis_cache import async_redis_cache
+from models.retrieval_cache import retrieval_cache
+from models.semantic_cache import semantic_cache
+
+ETL_EVENTS_ENABLED = os.getenv("ETL_EVENTS_ENABLED", "true").lower() == "true"
+KAFKA_BROKER = os.getenv("KAFKA_BROKER", "kafka_service:9092")
+KAFKA_TOPIC = os.getenv("KAFKA_TOPIC", "etl-events")
+KAFKA_GROUP_ID = os.getenv("KAFKA_GROUP_ID", "langchains-cache-invalidation")
+CACHE_WARM_TOP_N = int(os.getenv("CACHE_WARM_TOP_N", 20))
+RETRY_DELAY = 10
+
+
+class EtlEventConsumer:
+    """
+    Consume los eventos `etl_done` del DAG de ingesta.
+
+    Por cada ingesta incrementa la versión del corpus (las respuestas y búsquedas
+    cacheadas con otra versión dejan de servirse), borra las respuestas obsoletas,
+    vacía el cache semántico y re-genera en segundo plano las N preguntas más
+    frecuentes para precalentar el cache.
+
+    La invalidación es por versión del corpus y no por documento: un chunk nuevo
+    o modificado puede pasar a ser relevante para cualquier pregunta, no solo
+    para las que usaron el documento antes. Se invalida todo lo cacheado con la
+    versión anterior y el precalentado recupera las preguntas frecuentes.
+    """
+
+    def __init__(self, enabled: bool = ETL_EVENTS_ENABLED, warm_top_n: int = CACHE_WARM_TOP_N):
+        self.enabled = enabled
+        self.warm_top_n = warm_top_n
+        self._task: Optional[asyncio.Task] = None
+        self._warm_task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        for task in (self._task, self._warm_task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._task = None
+        self._warm_task = None
+
+    async def _run(self):
+        # Reintenta mientras Kafka no esté disponible sin afectar al resto del servicio
+        while True:
+            consumer = AIOKafkaConsumer(
+                KAFKA_TOPIC,
+                bootstrap_servers=KAFKA_BROKER,
+                group_id=KAFKA_GROUP_ID,
+                auto_offset_reset="latest",
+            )
+            try:
+                await consumer.start()
+                print(f"📡 Escuchando eventos de ingesta en {KAFKA_TOPIC}")
+                async for message in consumer:
+                    try:
+                        event = json.loads(message.value)
+                    except (TypeError, ValueError):
+                        continue
+                    if event.get("event") == "etl_done":
+                        await self.handle_etl_done(event)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error en el consumidor de eventos de ingesta: {e}. Reintentando en {RETRY_DELAY}s")
+            finally:
+                try:
+                    await consumer.stop()
+                except Exception:
+                    pass
+            await asyncio.sleep(RETRY_DELAY)
+
+    async def handle_etl_done(self, event: dict):
+        if not async_redis_cache.connected:
+            return
+        corpus_version = await async_redis_cache.bump_corpus_version()
+        if corpus_version is None:
+            return
+        deleted = await async_redis_cache.invalidate_stale_answers(corpus_version)
+        await semantic_cache.aclear()
+        retrieval_cache.invalidate()
+        print(f"♻️ Ingesta {event.get('timestamp')}: corpus v{corpus_version}, {deleted} respuestas invalidadas")
+
+        if self._warm_task is not None and not self._warm_task.done():
+            self._warm_task.cancel()
+        self._warm_task = asyncio.create_task(self.warm_cache())
+
+    async def warm_cache(self):
+        """Re-responde las preguntas más frecuentes con el corpus nuevo"""
+        questions = await async_redis_cache.top_questions(self.warm_top_n)
+        warmed = 0
+        for question in questions:
+            try:
+                if await awarm_answer(question) is not None:
+                    warmed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error precalentando '{question[:50]}': {e}")
+        print(f"🔥 Cache precalentado con {warmed}/{len(questions)} preguntas frecuentes")
+
+
+etl_consumer = EtlEventConsumer()
@@ -1,28 +1,104 @@
+import asyncio
+import json
+from contextlib import asynccontextmanager
 from fastapi import FastAPI 
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional
-from chain.rag_chain import generate_answer
-import asyncio
-from concurrent.futures import ThreadPoolExecutor
+from chain.context import load_tokenizer
+from chain.llm import preload_llm
+from chain.rag_chain import agenerate_answer, astream_answer, single_flight
+from models.qdrant_schemas import aclose_clients, aconfigure_docs_collection
+from models.redis_cache import async_redis_cache
+from models.semantic_cache import semantic_cache
+from models.retrieval_cache import retrieval_cache
+from models.reranker import reranker
+from consumers.conversation_archive import conversation_archive
+from consumers.etl_consumer import etl_consumer
+
 
-app = FastAPI(title="LangChains RAG service")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await async_redis_cache.connect()
+    await aconfigure_docs_collection()
+    # El modelo se carga en segundo plano: el servicio arranca aunque llm_service todavía no esté listo
+    preload = asyncio.create_task(preload_llm())
+    await asyncio.to_thread(load_tokenizer)
+    await etl_consumer.start()
+    await conversation_archive.start()
+    yield
+    preload.cancel()
+    await etl_consumer.stop()
+    await conversation_archive.stop()
+    # Los clientes HTTP se cierran después del archivado, que todavía embebe y escribe en Qdrant al apagar
+    await reranker.aclose()
+    await aclose_clients()
+    await async_redis_cache.close()
 
-# Thread pool para ejecutar funciones síncronas sin bloquear el event loop
-executor = ThreadPoolExecutor(max_workers=4)
+
+app = FastAPI(title="LangChains RAG service", lifespan=lifespan)
 
 class QueryRequest(BaseModel):
     pregunta: str
     thread_id: Optional[str] = None  # ID de conversación para mantener contexto
 
 
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
 @app.post("/query")
 async def query_rag(request: QueryRequest):
-    # Ejecutar la función síncrona en un thread pool para no bloquear el event loop
-    loop = asyncio.get_event_loop()
-    respuesta = await loop.run_in_executor(
-        executor, 
-        generate_answer, 
-        request.pregunta, 
-        request.thread_id
-    )
+    # Pipeline async de punta a punta: la concurrencia la limita el semáforo del LLM, no un thread pool
+    respuesta = await agenerate_answer(request.pregunta, request.thread_id)
     return {"respuesta": respuesta}
+
+
+@app.post("/query/stream")
+async def query_rag_stream(request: QueryRequest):
+    """
+    Server-Sent Events con los tokens del LLM.
+
+    Eventos: `token` ({"token": ...}) por cada chunk, `done` ({"respuesta": ...})
+    con la respuesta completa al final, o `error` ({"detail": ...}).
+    """
+    async def event_stream():
+        partes = []
+        try:
+            async for token in astream_answer(request.pregunta, request.thread_id):
+                partes.append(token)
+                yield _sse("token", {"token": token})
+            yield _sse("done", {"respuesta": "".join(partes)})
+        except Exception as e:
+            yield _sse("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/cache/semantic/stats")
+async def semantic_cache_stats():
+    return semantic_cache.stats()
+
+
+@app.get("/cache/retrieval/stats")
+async def retrieval_cache_stats():
+    return retrieval_cache.stats()
+
+
+@app.get("/conversations/archive/stats")
+async def conversation_archive_stats():
+    return conversation_archive.stats()
+
+
+@app.get("/rerank/stats")
+async def rerank_stats():
+    return reranker.stats()
+
+
+@app.get("/singleflight/stats")
+async def single_flight_stats():
+    return single_flight.stats()
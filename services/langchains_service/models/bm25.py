@@ -0,0 +1,33 @@
+import re
+import unicodedata
+import zlib
+from typing import List, Tuple
+
+# Vector sparse de la colección de documentos que indexa el DAG de ingesta
+SPARSE_VECTOR_NAME = "bm25"
+
+# Tokenización BM25: tiene que coincidir con la del DAG (services/airflow_dags/chunk_and_embedding.py),
+# lo verifica `python -m models.ingest_parity`
+STOPWORDS = frozenset("""
+    a al algo con como de del el en es esta este ha la las le lo los me mi mis no o para pero por que se si sin
+    su sus te tu tus un una uno unos unas y ya
+""".split())
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Minúsculas, sin acentos, sin stopwords ni tokens de una letra"""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return [token for token in _TOKEN_RE.findall(text) if len(token) > 1 and token not in STOPWORDS]
+
+
+def encode_query(text: str) -> Tuple[List[int], List[float]]:
+    """
+    Vector sparse de la consulta: peso 1 por término distinto.
+
+    Los pesos BM25 de los documentos los calcula el DAG y el IDF lo aplica Qdrant.
+    """
+    indices = sorted({zlib.crc32(token.encode()) for token in tokenize(text)})
+    return indices, [1.0] * len(indices)
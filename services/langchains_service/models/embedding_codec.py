@@ -0,0 +1,41 @@
+import struct
+
+import numpy as np
+
+# Debe coincidir con embedding_service/app/model/codec.py
+MAGIC = b"EMB"
+HEADER = struct.Struct("<3scII")
+
+MEDIA_TYPE_F32 = "application/x-embedding-f32"
+MEDIA_TYPE_F16 = "application/x-embedding-f16"
+MEDIA_TYPES = {"float32": MEDIA_TYPE_F32, "float16": MEDIA_TYPE_F16}
+
+_DTYPES = {
+    b"f": np.dtype("<f4"),
+    b"e": np.dtype("<f2"),
+}
+
+
+def is_binary_media_type(content_type: str) -> bool:
+    """Indica si el Content-Type de la respuesta es el formato binario de embeddings"""
+    media_type = (content_type or "").split(";")[0].strip().lower()
+    return media_type in (MEDIA_TYPE_F32, MEDIA_TYPE_F16)
+
+
+def decode_embeddings(buffer: bytes) -> np.ndarray:
+    """
+    Envuelve el buffer binario como matriz numpy (filas, dim) sin copiar.
+
+    El array resultante es de solo lectura y comparte memoria con `buffer`.
+    """
+    if len(buffer) < HEADER.size:
+        raise ValueError("Respuesta binaria de embeddings truncada")
+    magic, code, rows, dim = HEADER.unpack_from(buffer)
+    if magic != MAGIC or code not in _DTYPES:
+        raise ValueError("Formato binario de embeddings desconocido")
+
+    dtype = _DTYPES[code]
+    expected = HEADER.size + rows * dim * dtype.itemsize
+    if len(buffer) != expected:
+        raise ValueError(f"Tamaño de embeddings inválido: {len(buffer)} bytes, esperado {expected}")
+    return np.frombuffer(buffer, dtype=dtype, count=rows * dim, offset=HEADER.size).reshape(rows, dim)
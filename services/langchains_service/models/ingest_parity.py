@@ -0,0 +1,118 @@
+"""
+Chequeo de paridad entre el DAG de ingesta y el retrieval.
+
+El DAG (services/airflow_dags/chunk_and_embedding.py) corre en Airflow y no
+comparte código con este servicio, pero la tokenización BM25, el hashing de
+términos y las etiquetas de tema de los chunks tienen que ser idénticos a los
+de models/bm25.py y chain/intents.py. Si difieren, la búsqueda sparse y el
+filtro por tema dejan de encontrar documentos sin ningún error visible.
+
+Uso (desde services/langchains_service, sin Airflow instalado):
+    python -m models.ingest_parity [ruta/al/chunk_and_embedding.py]
+
+Termina con código 1 si alguna regla diverge.
+"""
+import ast
+import itertools
+import os
+import re
+import sys
+import unicodedata
+import zlib
+from collections import Counter
+from typing import Optional
+
+from qdrant_client.models import SparseVector
+
+from chain.intents import _DOC_TERMS, doc_topics
+from models.bm25 import SPARSE_VECTOR_NAME, STOPWORDS, encode_query, tokenize
+from models.qdrant_collections import DOCS_TOPICS_FIELD
+
+DAG_PATH = os.getenv(
+    "INGEST_DAG_PATH",
+    os.path.join(os.path.dirname(__file__), "..", "..", "airflow_dags", "chunk_and_embedding.py"),
+)
+
+# Definiciones del DAG que se comparan (el resto del módulo necesita Airflow, Redis y Kafka)
+DAG_NAMES = {
+    "STOPWORDS", "_TOKEN_RE", "_tokenizar", "SPARSE_VECTOR_NAME", "BM25_K1", "BM25_B", "BM25_AVG_DOC_LEN",
+    "_sparse_bm25", "TOPICS_FIELD", "TOPIC_TERMS", "_temas",
+}
+
+SAMPLE_TEXTS = [
+    "",
+    "Dirigite a un cajero automático Banelco con tu tarjeta de débito y elegí la opción generación de claves.",
+    "¿Cómo genero un nuevo token de seguridad en la App Macro?",
+    "ACTIVACIÓN del Token: ingresá al home banking de Banco Macro",
+    "Tasa de interés de un plazo fijo a 30 días (TNA 35,5%)",
+    "El titular podrá solicitar la tarjeta en cualquier sucursal; no se cobra comisión.",
+    "a e y o u ñandú pingüino Órgano cañón",
+]
+
+
+def load_dag_rules(path: str = DAG_PATH) -> dict:
+    """Ejecuta solo las definiciones de tokenización, BM25 y temas del archivo del DAG"""
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename=path)
+
+    def defines(node) -> set:
+        if isinstance(node, (ast.FunctionDef, ast.ClassDef)):
+            return {node.name}
+        if isinstance(node, ast.Assign):
+            return {target.id for target in node.targets if isinstance(target, ast.Name)}
+        return set()
+
+    body = [node for node in tree.body if defines(node) & DAG_NAMES]
+    namespace = {
+        "re": re, "unicodedata": unicodedata, "zlib": zlib, "Counter": Counter, "SparseVector": SparseVector,
+    }
+    exec(compile(ast.Module(body=body, type_ignores=[]), path, "exec"), namespace)
+    missing = DAG_NAMES - namespace.keys()
+    if missing:
+        raise ValueError(f"El DAG no define {', '.join(sorted(missing))}")
+    return namespace
+
+
+def _topic_texts(keywords: set) -> list:
+    """Cada palabra clave sola y junto a 'cajero', y todas las combinaciones de un representante por grupo"""
+    texts = [f"texto con {keyword} al medio" for keyword in sorted(keywords)]
+    texts += [f"cajero {keyword}" for keyword in sorted(keywords)]
+    representatives = ["dirigite", "cajero", "banelco", "tarjeta", "claves", "token"]
+    for n in range(len(representatives) + 1):
+        texts += [" ".join(combo) for combo in itertools.combinations(representatives, n)]
+    return texts
+
+
+def check(path: str = DAG_PATH, texts: Optional[list] = None) -> list:
+    """Devuelve la lista de diferencias entre las reglas del DAG y las del retrieval (vacía si coinciden)"""
+    dag = load_dag_rules(path)
+    errors = []
+    if dag["STOPWORDS"] != STOPWORDS:
+        errors.append(f"STOPWORDS: solo en el DAG {sorted(dag['STOPWORDS'] - STOPWORDS)}, "
+                      f"solo en bm25.py {sorted(STOPWORDS - dag['STOPWORDS'])}")
+    if dag["SPARSE_VECTOR_NAME"] != SPARSE_VECTOR_NAME:
+        errors.append(f"SPARSE_VECTOR_NAME: {dag['SPARSE_VECTOR_NAME']!r} != {SPARSE_VECTOR_NAME!r}")
+    if dag["TOPICS_FIELD"] != DOCS_TOPICS_FIELD:
+        errors.append(f"TOPICS_FIELD: {dag['TOPICS_FIELD']!r} != {DOCS_TOPICS_FIELD!r}")
+
+    keywords = {word for words in dag["TOPIC_TERMS"].values() for word in words} | set(_DOC_TERMS._groups)
+    for text in (texts or SAMPLE_TEXTS) + _topic_texts(keywords):
+        if dag["_tokenizar"](text) != tokenize(text):
+            errors.append(f"tokenización de {text!r}: {dag['_tokenizar'](text)} != {tokenize(text)}")
+        elif sorted(dag["_sparse_bm25"](text).indices) != encode_query(text)[0]:
+            errors.append(f"índices BM25 de {text!r}")
+        if dag["_temas"](text) != doc_topics(text):
+            errors.append(f"temas de {text!r}: {dag['_temas'](text)} != {doc_topics(text)}")
+    return errors
+
+
+def main(path: str = DAG_PATH) -> int:
+    errors = check(path)
+    for error in errors:
+        print(f"❌ {error}")
+    print("✅ Reglas del DAG y del retrieval idénticas" if not errors else f"{len(errors)} diferencias")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(*sys.argv[1:]))
@@ -0,0 +1,129 @@
+import os
+from typing import Optional
+
+from qdrant_client import AsyncQdrantClient
+from qdrant_client import models as qmodels
+from models.bm25 import SPARSE_VECTOR_NAME
+
+VECTOR_SIZE = int(os.getenv("VECTOR_SIZE", 768))
+# Cuantización escalar int8: los vectores cuantizados quedan en RAM y los originales en disco para el rescoring
+QDRANT_QUANTIZATION_ENABLED = os.getenv("QDRANT_QUANTIZATION_ENABLED", "true").lower() == "true"
+QDRANT_QUANTIZATION_QUANTILE = float(os.getenv("QDRANT_QUANTIZATION_QUANTILE", 0.99))
+QDRANT_VECTORS_ON_DISK = os.getenv("QDRANT_VECTORS_ON_DISK", "true").lower() == "true"
+QDRANT_HNSW_M = int(os.getenv("QDRANT_HNSW_M", 16))
+QDRANT_HNSW_EF_CONSTRUCT = int(os.getenv("QDRANT_HNSW_EF_CONSTRUCT", 128))
+# Parámetros por consulta
+QDRANT_HNSW_EF = int(os.getenv("QDRANT_HNSW_EF", 64))
+QDRANT_RESCORE = os.getenv("QDRANT_RESCORE", "true").lower() == "true"
+QDRANT_OVERSAMPLING = float(os.getenv("QDRANT_OVERSAMPLING", 2.0))
+
+# Etiquetas de tema de cada chunk (las asigna el DAG de ingesta, ver chain.intents.DOC_FILTERS)
+DOCS_TOPICS_FIELD = "topics"
+# Índices de payload de la colección de documentos (campos usados en filtros y borrados)
+DOCS_PAYLOAD_INDEXES = {
+    "source_id": qmodels.PayloadSchemaType.KEYWORD,
+    DOCS_TOPICS_FIELD: qmodels.PayloadSchemaType.KEYWORD,
+}
+# Único campo del payload que necesita el retrieval
+DOCS_PAYLOAD_FIELDS = ["text"]
+
+
+def vector_params(size: int = VECTOR_SIZE) -> qmodels.VectorParams:
+    return qmodels.VectorParams(size=size, distance=qmodels.Distance.COSINE, on_disk=QDRANT_VECTORS_ON_DISK)
+
+
+def hnsw_config() -> qmodels.HnswConfigDiff:
+    return qmodels.HnswConfigDiff(m=QDRANT_HNSW_M, ef_construct=QDRANT_HNSW_EF_CONSTRUCT)
+
+
+def quantization_config() -> Optional[qmodels.ScalarQuantization]:
+    if not QDRANT_QUANTIZATION_ENABLED:
+        return None
+    return qmodels.ScalarQuantization(
+        scalar=qmodels.ScalarQuantizationConfig(
+            type=qmodels.ScalarType.INT8,
+            quantile=QDRANT_QUANTIZATION_QUANTILE,
+            always_ram=True,
+        )
+    )
+
+
+def search_params() -> qmodels.SearchParams:
+    """hnsw_ef por consulta y, con cuantización, oversampling + rescoring contra los vectores originales"""
+    quantization = None
+    if QDRANT_QUANTIZATION_ENABLED:
+        quantization = qmodels.QuantizationSearchParams(rescore=QDRANT_RESCORE, oversampling=QDRANT_OVERSAMPLING)
+    return qmodels.SearchParams(hnsw_ef=QDRANT_HNSW_EF, quantization=quantization)
+
+
+def collection_config(size: int = VECTOR_SIZE, sparse: bool = False) -> dict:
+    """Argumentos de create_collection: vector denso sin nombre y, opcionalmente, el sparse BM25"""
+    config = {
+        "vectors_config": vector_params(size),
+        "hnsw_config": hnsw_config(),
+        "quantization_config": quantization_config(),
+    }
+    if sparse:
+        config["sparse_vectors_config"] = {
+            SPARSE_VECTOR_NAME: qmodels.SparseVectorParams(modifier=qmodels.Modifier.IDF)
+        }
+    return config
+
+
+def _migration(info: qmodels.CollectionInfo) -> dict:
+    """Argumentos de update_collection para llevar una colección existente a la configuración actual"""
+    changes = {}
+    vectors = info.config.params.vectors
+    if isinstance(vectors, qmodels.VectorParams) and bool(vectors.on_disk) != QDRANT_VECTORS_ON_DISK:
+        changes["vectors_config"] = {"": qmodels.VectorParamsDiff(on_disk=QDRANT_VECTORS_ON_DISK)}
+
+    hnsw = info.config.hnsw_config
+    if hnsw.m != QDRANT_HNSW_M or hnsw.ef_construct != QDRANT_HNSW_EF_CONSTRUCT:
+        changes["hnsw_config"] = hnsw_config()
+
+    desired = quantization_config()
+    current = info.config.quantization_config
+    if desired is not None and current != desired:
+        changes["quantization_config"] = desired
+    elif desired is None and current is not None:
+        changes["quantization_config"] = qmodels.Disabled.DISABLED
+    return changes
+
+
+def _missing_indexes(info: qmodels.CollectionInfo, payload_indexes: dict) -> dict:
+    existing = info.payload_schema or {}
+    return {field: schema for field, schema in payload_indexes.items() if field not in existing}
+
+
+async def aensure_collection(
+    client: AsyncQdrantClient,
+    name: str,
+    size: int = VECTOR_SIZE,
+    sparse: bool = False,
+    payload_indexes: Optional[dict] = None,
+    create: bool = True,
+) -> bool:
+    """
+    Crea la colección con la configuración de memoria (cuantización, HNSW, originales en disco)
+    o migra una existente que no la tenga, y agrega los índices de payload faltantes.
+
+    Con create=False solo migra. Devuelve si la colección existe al terminar.
+    """
+    payload_indexes = payload_indexes or {}
+    if not await client.collection_exists(name):
+        if not create:
+            return False
+        await client.create_collection(collection_name=name, **collection_config(size, sparse))
+        missing = payload_indexes
+        print(f"✅ Colección '{name}' creada (int8={QDRANT_QUANTIZATION_ENABLED}, on_disk={QDRANT_VECTORS_ON_DISK})")
+    else:
+        info = await client.get_collection(name)
+        changes = _migration(info)
+        if changes:
+            await client.update_collection(collection_name=name, **changes)
+            print(f"🔧 Colección '{name}' migrada: {', '.join(changes)}")
+        missing = _missing_indexes(info, payload_indexes)
+
+    for field, schema in missing.items():
+        await client.create_payload_index(collection_name=name, field_name=field, field_schema=schema)
+    return True
@@ -1,54 +1,134 @@
+import asyncio
 import os
 import httpx
+import threading
 import time
-from langchain_qdrant import QdrantVectorStore
-from qdrant_client import QdrantClient
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.http.exceptions import UnexpectedResponse
+from qdrant_client.models import FieldCondition, Filter, Fusion, FusionQuery, MatchValue, Prefetch, SparseVector
+from langchain_core.documents import Document
 from langchain_core.embeddings import Embeddings
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Optional
+from models.bm25 import SPARSE_VECTOR_NAME, encode_query
+from models.qdrant_collections import (
+    DOCS_PAYLOAD_FIELDS, DOCS_PAYLOAD_INDEXES, DOCS_TOPICS_FIELD, aensure_collection, search_params,
+)
+from models.embedding_codec import MEDIA_TYPES, decode_embeddings, is_binary_media_type
 
 QDRANT_URL = os.getenv("QDRANT_URL", "http://qdrant:6333")
 QDRANT_API_KEY = os.getenv("QDRANT_API_KEY", "dev_key_123")
 EMBEDDING_SERVICE_URL = os.getenv("EMBEDDING_SERVICE_URL", "http://embedding_service:8001/embedding")
 DOCS_COLLECTION = os.getenv("QDRANT_COLLECTION_DOCS", "embeddings_collection")
 CONVERSATIONS_COLLECTION = os.getenv("QDRANT_COLLECTION_CONVERSATIONS", "conversations")
+EMBEDDING_RESPONSE_FORMAT = os.getenv("EMBEDDING_RESPONSE_FORMAT", "float32")
+EMBEDDING_TIMEOUT = float(os.getenv("EMBEDDING_TIMEOUT", 60))
+EMBEDDING_POOL_MAX_CONNECTIONS = int(os.getenv("EMBEDDING_POOL_MAX_CONNECTIONS", 20))
+EMBEDDING_POOL_MAX_KEEPALIVE = int(os.getenv("EMBEDDING_POOL_MAX_KEEPALIVE", 10))
+EMBEDDING_CLIENT_BATCH_SIZE = int(os.getenv("EMBEDDING_CLIENT_BATCH_SIZE", 64))
+EMBEDDING_CLIENT_CONCURRENCY = int(os.getenv("EMBEDDING_CLIENT_CONCURRENCY", 4))
+HYBRID_SEARCH_ENABLED = os.getenv("HYBRID_SEARCH_ENABLED", "true").lower() == "true"
+HYBRID_PREFETCH_K = int(os.getenv("HYBRID_PREFETCH_K", 20))
+HYBRID_RETRY_INTERVAL = 300
 
 class RemoteEmbeddingFunction(Embeddings):
-    def embed_query(self, text: str) -> List[float]:
-        response = httpx.post(EMBEDDING_SERVICE_URL, json={"texts": [text]}, timeout=60)
-        response.raise_for_status()
-        return response.json()[0] 
+    """
+    Embeddings remotos contra embedding_service.
 
-    def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        response = httpx.post(EMBEDDING_SERVICE_URL, json={"texts": texts}, timeout=60)
+    Mantiene clientes HTTP de larga vida (keep-alive y pool acotado) y parte
+    los `embed_documents` grandes en sub-batches que se envían en paralelo.
+    """
+
+    def __init__(self, response_format: str = EMBEDDING_RESPONSE_FORMAT):
+        # "float32"/"float16" piden el formato binario al servicio; "json" mantiene listas de floats
+        media_type = MEDIA_TYPES.get(response_format)
+        self.headers = {"Accept": f"{media_type}, application/json;q=0.5"} if media_type else {}
+        self.batch_size = max(1, EMBEDDING_CLIENT_BATCH_SIZE)
+        self.concurrency = max(1, EMBEDDING_CLIENT_CONCURRENCY)
+        self._limits = httpx.Limits(
+            max_connections=EMBEDDING_POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=EMBEDDING_POOL_MAX_KEEPALIVE,
+        )
+        self._client = httpx.Client(limits=self._limits, timeout=EMBEDDING_TIMEOUT, headers=self.headers)
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_async_client(self) -> httpx.AsyncClient:
+        if self._async_client is None or self._async_client.is_closed:
+            self._async_client = httpx.AsyncClient(limits=self._limits, timeout=EMBEDDING_TIMEOUT, headers=self.headers)
+        return self._async_client
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="embedding-client")
+            return self._executor
+
+    def _batches(self, texts: List[str]) -> List[List[str]]:
+        return [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+
+    def _parse(self, response: httpx.Response) -> List[List[float]]:
         response.raise_for_status()
+        if is_binary_media_type(response.headers.get("content-type")):
+            return decode_embeddings(response.content).tolist()
         return response.json()
 
+    def _post(self, texts: List[str]) -> httpx.Response:
+        return self._client.post(EMBEDDING_SERVICE_URL, json={"texts": texts})
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._parse(self._post([text]))[0]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        batches = self._batches(texts)
+        if len(batches) == 1:
+            return self._parse(self._post(texts))
+        results = self._get_executor().map(lambda batch: self._parse(self._post(batch)), batches)
+        return [vector for batch in results for vector in batch]
+
+    async def _apost(self, texts: List[str]) -> List[List[float]]:
+        response = await self._get_async_client().post(EMBEDDING_SERVICE_URL, json={"texts": texts})
+        return self._parse(response)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self._apost([text]))[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def embed_batch(batch: List[str]) -> List[List[float]]:
+            async with semaphore:
+                return await self._apost(batch)
+
+        results = await asyncio.gather(*(embed_batch(batch) for batch in self._batches(texts)))
+        return [vector for batch in results for vector in batch]
+
+    def close(self):
+        """Cierra el cliente síncrono y el pool de threads"""
+        self._client.close()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+        self.close()
+
 # Variables globales para inicialización lazy
 _embedding_function: Optional[RemoteEmbeddingFunction] = None
-_client: Optional[QdrantClient] = None
-_qdrant_docs: Optional[QdrantVectorStore] = None
-_qdrant_conversations: Optional[QdrantVectorStore] = None
-
-def _get_client() -> QdrantClient:
-    """Obtiene o crea el cliente de Qdrant con retry logic."""
-    global _client
-    if _client is None:
-        max_retries = 5
-        retry_delay = 2
-        
-        for attempt in range(max_retries):
-            try:
-                _client = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY, timeout=10)
-                # Verificar conexión
-                _client.get_collections()
-                return _client
-            except Exception as e:
-                if attempt < max_retries - 1:
-                    print(f"Error conectando a Qdrant (intento {attempt + 1}/{max_retries}): {e}. Reintentando...")
-                    time.sleep(retry_delay)
-                else:
-                    raise Exception(f"No se pudo conectar a Qdrant después de {max_retries} intentos: {e}")
-    return _client
+_async_client: Optional[AsyncQdrantClient] = None
+
+def _get_async_client() -> AsyncQdrantClient:
+    """Obtiene o crea el cliente async de Qdrant (la conexión se valida en la primera consulta)."""
+    global _async_client
+    if _async_client is None:
+        _async_client = AsyncQdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY, timeout=10)
+    return _async_client
 
 def _get_embedding_function() -> RemoteEmbeddingFunction:
     """Obtiene o crea la función de embeddings."""
@@ -57,98 +137,88 @@ def _get_embedding_function() -> RemoteEmbeddingFunction:
         _embedding_function = RemoteEmbeddingFunction()
     return _embedding_function
 
-def get_qdrant_docs() -> QdrantVectorStore:
-    """Obtiene o crea el vector store de documentos."""
-    global _qdrant_docs
-    if _qdrant_docs is None:
-        client = _get_client()
-        embedding_function = _get_embedding_function()
-        _qdrant_docs = QdrantVectorStore(
-            client=client,
-            collection_name=DOCS_COLLECTION,
-            embedding=embedding_function,
-            content_payload_key="text",  # Campo del payload que contiene el texto
-        )
-    return _qdrant_docs
+async def aclose_clients():
+    """Cierra los pools HTTP de embeddings y el cliente async de Qdrant (al apagar la aplicación)"""
+    if _embedding_function is not None:
+        await _embedding_function.aclose()
+    if _async_client is not None:
+        await _async_client.close()
+
+# Si la colección todavía no tiene vectores BM25 se busca solo denso hasta este instante
+_hybrid_retry_at = 0.0
 
-def get_qdrant_conversations() -> Optional[QdrantVectorStore]:
-    """Obtiene o crea el vector store de conversaciones si existe."""
-    global _qdrant_conversations
-    if _qdrant_conversations is None:
+def _hybrid_available() -> bool:
+    return HYBRID_SEARCH_ENABLED and time.monotonic() >= _hybrid_retry_at
+
+def _hybrid_unsupported(error: Exception) -> bool:
+    """
+    Errores de esquema de la consulta híbrida: la colección no tiene el vector
+    sparse BM25 (corpus ingestado antes del DAG híbrido) o el servidor no
+    conoce la Query API (404 del endpoint, no de la colección).
+    """
+    message = str(error).lower()
+    if SPARSE_VECTOR_NAME in message:
+        return True
+    return isinstance(error, UnexpectedResponse) and error.status_code == 404 and "collection" not in message
+
+def _disable_hybrid(error: Exception):
+    global _hybrid_retry_at
+    _hybrid_retry_at = time.monotonic() + HYBRID_RETRY_INTERVAL
+    print(f"Advertencia: búsqueda híbrida no disponible, se usa solo la densa: {error}")
+
+def topic_filter(topic: Optional[str]) -> Optional[Filter]:
+    """Filtro de Qdrant que deja solo los chunks etiquetados con `topic`"""
+    if topic is None:
+        return None
+    return Filter(must=[FieldCondition(key=DOCS_TOPICS_FIELD, match=MatchValue(value=topic))])
+
+def _hybrid_query(query: str, embedding: List[float], k: int, query_filter: Optional[Filter] = None) -> dict:
+    """Prefetch denso + sparse BM25 fusionados con reciprocal rank fusion en una sola consulta."""
+    limit = max(k, HYBRID_PREFETCH_K)
+    prefetch = [Prefetch(query=embedding, filter=query_filter, limit=limit, params=search_params())]
+    indices, values = encode_query(query)
+    if indices:
+        prefetch.append(Prefetch(
+            query=SparseVector(indices=indices, values=values), using=SPARSE_VECTOR_NAME, filter=query_filter, limit=limit
+        ))
+    return {"prefetch": prefetch, "query": FusionQuery(fusion=Fusion.RRF), "limit": k}
+
+def _to_documents(points) -> List[Document]:
+    documents = []
+    for point in points:
+        payload = point.payload or {}
+        metadata = dict(payload.get("metadata") or {})
+        metadata["_id"] = point.id
+        metadata["_collection_name"] = DOCS_COLLECTION
+        documents.append(Document(page_content=payload.get("text", ""), metadata=metadata))
+    return documents
+
+async def asearch_docs(query: str, k: int = 4, query_filter: Optional[Filter] = None) -> List[Document]:
+    """Búsqueda híbrida async (embedding y Qdrant sin threads)."""
+    embedding = await _get_embedding_function().aembed_query(query)
+    client = _get_async_client()
+    if _hybrid_available():
         try:
-            client = _get_client()
-            embedding_function = _get_embedding_function()
-            
-            # Verificar si existe la colección
-            existing_collections = [c.name for c in client.get_collections().collections]
-            
-            if CONVERSATIONS_COLLECTION in existing_collections:
-                _qdrant_conversations = QdrantVectorStore(
-                    client=client,
-                    collection_name=CONVERSATIONS_COLLECTION,
-                    embedding=embedding_function
-                )
+            result = await client.query_points(
+                collection_name=DOCS_COLLECTION, with_payload=DOCS_PAYLOAD_FIELDS, **_hybrid_query(query, embedding, k, query_filter)
+            )
+            return _to_documents(result.points)
         except Exception as e:
-            print(f"Advertencia: No se pudo inicializar la colección de conversaciones: {e}")
-            _qdrant_conversations = None
-    return _qdrant_conversations
-
-class _LazyQdrantDocs:
-    """Wrapper lazy para qdrant_docs que se inicializa solo cuando se accede."""
-    def __init__(self):
-        self._instance = None
-    
-    def _get_instance(self):
-        if self._instance is None:
-            self._instance = get_qdrant_docs()
-        return self._instance
-    
-    def __getattr__(self, name):
-        return getattr(self._get_instance(), name)
-    
-    def __call__(self, *args, **kwargs):
-        return self._get_instance()(*args, **kwargs)
-
-class _LazyQdrantConversations:
-    """Wrapper lazy para qdrant_conversations que se inicializa solo cuando se accede."""
-    def __init__(self):
-        self._instance = None
-        self._initialized = False
-    
-    def _get_instance(self):
-        if not self._initialized:
-            self._instance = get_qdrant_conversations()
-            self._initialized = True
-        return self._instance
-    
-    def _is_available(self):
-        """Verifica si la instancia está disponible sin inicializarla si no es necesario."""
-        if not self._initialized:
-            # Solo inicializar cuando se necesite verificar
-            self._get_instance()
-        return self._instance is not None
-    
-    def __getattr__(self, name):
-        instance = self._get_instance()
-        if instance is None:
-            raise AttributeError(f"'NoneType' object has no attribute '{name}'")
-        return getattr(instance, name)
-    
-    def __call__(self, *args, **kwargs):
-        instance = self._get_instance()
-        if instance is None:
-            return None
-        return instance(*args, **kwargs)
-    
-    def __bool__(self):
-        return self._is_available()
-    
-    def __repr__(self):
-        if not self._initialized:
-            return f"<LazyQdrantConversations (not initialized)>"
-        return f"<LazyQdrantConversations (available={self._instance is not None})>"
-
-# Variables para compatibilidad con código existente
-qdrant_docs = _LazyQdrantDocs()
-qdrant_conversations = _LazyQdrantConversations()
-    
\ No newline at end of file
+            # Timeouts o errores transitorios de Qdrant se propagan: no apagan la búsqueda híbrida
+            if not _hybrid_unsupported(e):
+                raise
+            _disable_hybrid(e)
+    result = await client.query_points(
+        collection_name=DOCS_COLLECTION, query=embedding, query_filter=query_filter, limit=k,
+        with_payload=DOCS_PAYLOAD_FIELDS, search_params=search_params(),
+    )
+    return _to_documents(result.points)
+
+async def aconfigure_docs_collection():
+    """Migra la colección de documentos a la configuración de memoria actual (la crea el DAG de ingesta)"""
+    try:
+        await aensure_collection(
+            _get_async_client(), DOCS_COLLECTION, sparse=True, payload_indexes=DOCS_PAYLOAD_INDEXES, create=False
+        )
+    except Exception as e:
+        print(f"Advertencia: No se pudo configurar la colección de documentos: {e}")
@@ -1,96 +1,278 @@
-import redis
+import redis.asyncio as aioredis
 import json
 import os
 from typing import Optional 
 import hashlib
+import random
 
 REDIS_HOST = os.getenv("REDIS_HOST", "redis_service")
 REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
+# Conexiones máximas del pool compartido (cache, retrieval cache, single-flight)
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 128))
 CACHE_TTL = int(os.getenv("CACHE_TTL", 3600))
+# Historial de conversación: 7 días, últimos 50 mensajes
+CONVERSATION_TTL = 604800
+CONVERSATION_MAX_MESSAGES = 50
+# Mensajes del historial que se leen por request (los que usa el contexto del prompt)
+CONVERSATION_CONTEXT_MESSAGES = int(os.getenv("CONVERSATION_CONTEXT_MESSAGES", 3))
 
-class RedisCache:
-    """Cache de respuestas usando Redis"""
+# Versión del corpus: se incrementa con cada ingesta (evento etl_done)
+CORPUS_VERSION_KEY = "corpus:version"
+# Frecuencia de preguntas para precalentar el cache después de una ingesta
+QUESTION_FREQ_KEY = "stats:question_freq"
+QUESTION_FREQ_MAX = int(os.getenv("QUESTION_FREQ_MAX", 10000))
+# En promedio una de cada QUESTION_FREQ_TRIM_EVERY escrituras recorta el ranking a QUESTION_FREQ_MAX
+QUESTION_FREQ_TRIM_EVERY = int(os.getenv("QUESTION_FREQ_TRIM_EVERY", 100))
+QUESTION_FREQ_TTL = int(os.getenv("QUESTION_FREQ_TTL", 604800))
+
+
+def normalize_question(question: str) -> str:
+    return question.lower().strip()
+
+
+def _fresh_answer(cached: Optional[str], corpus_version: Optional[str]) -> Optional[str]:
+    """Respuesta del cache si fue generada con la versión actual del corpus"""
+    if not cached:
+        return None
+    data = json.loads(cached)
+    if corpus_version is not None and data.get("corpus_version") != corpus_version:
+        return None
+    return data.get("answer")
+
+
+def question_cache_key(question: str) -> str:
+    """Clave de cache de una pregunta (normalizada en minúsculas y sin espacios extremos)"""
+    normalized = normalize_question(question)
+    hash_obj = hashlib.sha256(normalized.encode())
+    return f"cache:question:{hash_obj.hexdigest()}"
+
+
+def conversation_key(thread_id: str) -> str:
+    return f"conversation:{thread_id}"
+
+
+def _answer_payload(question: str, answer: str, corpus_version: Optional[str]) -> str:
+    return json.dumps({
+        "question": question,
+        "answer": answer,
+        "corpus_version": corpus_version,
+    })
+
+
+def _queue_question_freq(pipe, question: str):
+    """Encola el conteo de frecuencia de la pregunta; el ranking queda acotado en tamaño y con expiración"""
+    pipe.zincrby(QUESTION_FREQ_KEY, 1, normalize_question(question))
+    pipe.expire(QUESTION_FREQ_KEY, QUESTION_FREQ_TTL)
+    if random.random() * QUESTION_FREQ_TRIM_EVERY < 1:
+        pipe.zremrangebyrank(QUESTION_FREQ_KEY, 0, -(QUESTION_FREQ_MAX + 1))
+
+
+def _queue_lookup(pipe, question: str, thread_id: str, limit: int):
+    """Encola la lectura del historial, la respuesta cacheada, la versión del corpus y el conteo de frecuencia"""
+    pipe.lrange(conversation_key(thread_id), -limit, -1)
+    pipe.get(question_cache_key(question))
+    pipe.get(CORPUS_VERSION_KEY)
+    _queue_question_freq(pipe, question)
+
+
+def _parse_lookup(results) -> tuple[Optional[str], list, Optional[str]]:
+    history, cached, corpus_version = results[:3]
+    return _fresh_answer(cached, corpus_version), [json.loads(item) for item in history], corpus_version
+
+
+def _queue_save_to_conversation(pipe, thread_id: str, question: str, answer: str):
+    """Encola el append al historial, el recorte a los últimos mensajes y la expiración"""
+    key = conversation_key(thread_id)
+    pipe.rpush(key, json.dumps({"question": question, "answer": answer}))
+    pipe.ltrim(key, -CONVERSATION_MAX_MESSAGES, -1)
+    pipe.expire(key, CONVERSATION_TTL)
+
+
+class AsyncRedisCache:
+    """Cache de respuestas usando Redis (redis.asyncio)"""
 
     def __init__(self):
+        # Pool compartido por todos los usuarios de `client` (retrieval cache, single-flight, consumer)
+        self.pool = aioredis.ConnectionPool(
+            host=REDIS_HOST,
+            port=REDIS_PORT,
+            decode_responses=True,
+            socket_connect_timeout=5,
+            max_connections=REDIS_MAX_CONNECTIONS
+        )
+        self.client = aioredis.Redis(connection_pool=self.pool)
+        self.connected = False
+
+    async def connect(self):
+        """Verifica la conexión; se llama al iniciar la aplicación"""
         try:
-            self.client = redis.Redis(
-                host=REDIS_HOST, 
-                port=REDIS_PORT, 
-                decode_responses=True,
-                socket_connect_timeout=5
-            )
-            self.client.ping()
+            await self.client.ping()
             self.connected = True
         except Exception as e:
-            print(f"Error al conectar a Redis: {e}")
+            print(f"Error al conectar a Redis (async): {e}")
             self.connected = False
 
+    async def close(self):
+        await self.client.aclose()
+        await self.pool.aclose()
+
     def _generate_key(self, question: str) -> str:
         """Genera una clave única para la pregunta"""
-        normalized = question.lower().strip()
-        hash_obj = hashlib.sha256(normalized.encode())
-        return f"cache:question:{hash_obj.hexdigest()}"
+        return question_cache_key(question)
 
-    def get_cached_answer(self, question: str) -> Optional[str]:
+    async def get_cached_answer(self, question: str) -> Optional[str]:
         """Obtiene respuesta cacheada si existe"""
         if not self.connected:
             return None
-        
+
         try:
             key = self._generate_key(question)
-            cached = self.client.get(key)
-            if cached:
-                data = json.loads(cached)
-                return data.get("answer")
+            # Respuesta, versión del corpus y conteo de frecuencia en un solo round trip
+            pipe = self.client.pipeline(transaction=False)
+            pipe.get(key)
+            pipe.get(CORPUS_VERSION_KEY)
+            _queue_question_freq(pipe, question)
+            cached, corpus_version = (await pipe.execute())[:2]
+            return _fresh_answer(cached, corpus_version)
         except Exception as e:
             print(f"Error al obtener la respuesta cacheada: {e}")
 
         return None
 
-    def cache_answer(self, question: str, answer: str, ttl: int = None):
-        """Guarda respuesta en cache"""
+    async def lookup(self, question: str, thread_id: str, limit: int = CONVERSATION_CONTEXT_MESSAGES) -> tuple[Optional[str], list, Optional[str]]:
+        """
+        Lecturas del inicio de un request en un solo round trip.
+
+        Devuelve (respuesta cacheada vigente o None, últimos `limit` mensajes del
+        historial, versión del corpus).
+        """
+        if not self.connected:
+            return None, [], None
+
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            _queue_lookup(pipe, question, thread_id, limit)
+            return _parse_lookup(await pipe.execute())
+        except Exception as e:
+            print(f"Error al obtener la respuesta cacheada: {e}")
+            return None, [], None
+
+    async def peek_cached_answer(self, question: str) -> Optional[str]:
+        """Como get_cached_answer pero sin contar la pregunta en las estadísticas de frecuencia"""
+        if not self.connected:
+            return None
+        try:
+            cached, corpus_version = await self.client.mget(self._generate_key(question), CORPUS_VERSION_KEY)
+            return _fresh_answer(cached, corpus_version)
+        except Exception as e:
+            print(f"Error al obtener la respuesta cacheada: {e}")
+            return None
+
+    async def cache_answer(self, question: str, answer: str, ttl: int = None, corpus_version: str = None):
+        """Guarda respuesta en cache, etiquetada con la versión del corpus"""
         if not self.connected:
             return
         try:
             key = self._generate_key(question)
-            data = {
-                "question": question,
-                "answer": answer,
-            }
-            ttl = ttl or CACHE_TTL
-            self.client.setex(key, ttl, json.dumps(data))
+            if corpus_version is None:
+                corpus_version = await self.client.get(CORPUS_VERSION_KEY)
+            await self.client.setex(key, ttl or CACHE_TTL, _answer_payload(question, answer, corpus_version))
         except Exception as e:
             print(f"Error al cachear la respuesta: {e}")
 
-    def get_conversation_cache(self, thread_id: str) -> list:
-        """Obtiene historial de conversación desde Redis"""
+    async def record_answer(self, thread_id: str, question: str, answer: str, corpus_version: str = None):
+        """cache_answer + save_to_conversation en una sola transacción (un round trip si se conoce la versión)"""
+        if not self.connected:
+            return
+        try:
+            if corpus_version is None:
+                corpus_version = await self.client.get(CORPUS_VERSION_KEY)
+            pipe = self.client.pipeline(transaction=True)
+            pipe.setex(self._generate_key(question), CACHE_TTL, _answer_payload(question, answer, corpus_version))
+            _queue_save_to_conversation(pipe, thread_id, question, answer)
+            await pipe.execute()
+        except Exception as e:
+            print(f"Error al cachear la respuesta: {e}")
+
+    async def get_corpus_version(self) -> Optional[str]:
+        if not self.connected:
+            return None
+        return await self.client.get(CORPUS_VERSION_KEY)
+
+    async def bump_corpus_version(self) -> Optional[str]:
+        """Marca una nueva versión del corpus: las respuestas cacheadas anteriores quedan obsoletas"""
+        if not self.connected:
+            return None
+        try:
+            return str(await self.client.incr(CORPUS_VERSION_KEY))
+        except Exception as e:
+            print(f"Error incrementando la versión del corpus: {e}")
+            return None
+
+    async def invalidate_stale_answers(self, corpus_version: str, batch_size: int = 500) -> int:
+        """Borra las respuestas cacheadas con una versión del corpus distinta a `corpus_version`"""
+        if not self.connected:
+            return 0
+        deleted = 0
+        keys = []
+
+        async def flush(batch):
+            values = await self.client.mget(batch)
+            stale = [
+                key for key, value in zip(batch, values)
+                if value and json.loads(value).get("corpus_version") != corpus_version
+            ]
+            if stale:
+                await self.client.unlink(*stale)
+            return len(stale)
+
+        try:
+            async for key in self.client.scan_iter(match="cache:question:*", count=batch_size):
+                keys.append(key)
+                if len(keys) >= batch_size:
+                    deleted += await flush(keys)
+                    keys = []
+            if keys:
+                deleted += await flush(keys)
+        except Exception as e:
+            # Lo que no se borró igual deja de servirse: la versión ya no coincide
+            print(f"Error borrando respuestas obsoletas: {e}")
+        return deleted
+
+    async def top_questions(self, n: int) -> list[str]:
+        """Preguntas más frecuentes (normalizadas); recorta el ranking a QUESTION_FREQ_MAX"""
+        if not self.connected or n <= 0:
+            return []
+        try:
+            await self.client.zremrangebyrank(QUESTION_FREQ_KEY, 0, -(QUESTION_FREQ_MAX + 1))
+            return await self.client.zrevrange(QUESTION_FREQ_KEY, 0, n - 1)
+        except Exception as e:
+            print(f"Error leyendo las preguntas frecuentes: {e}")
+            return []
+
+    async def get_conversation_cache(self, thread_id: str, limit: int = CONVERSATION_CONTEXT_MESSAGES) -> list:
+        """Obtiene los últimos `limit` mensajes del historial de conversación desde Redis"""
         if not self.connected:
             return []
 
         try:
-            key = f"conversation:{thread_id}"    
-            cached = self.client.lrange(key, 0, -1)
+            cached = await self.client.lrange(conversation_key(thread_id), -limit, -1)
             return [json.loads(item) for item in cached]
         except Exception as e:
             print(f"Error obteniendo historial: {e}")
             return []
 
-    def save_to_conversation(self, thread_id: str, question: str, answer: str):
+    async def save_to_conversation(self, thread_id: str, question: str, answer: str):
         """Guarda mensaje en historial de conversación"""
         if not self.connected:
             return
-        
+
         try:
-            key = f"conversation:{thread_id}"
-            data = {"question": question, "answer": answer}
-            # Primero agregar el mensaje
-            self.client.rpush(key, json.dumps(data))
-            # Luego mantener solo últimas 50 mensajes
-            self.client.ltrim(key, -50, -1)
-            # Expirar después de 7 días
-            self.client.expire(key, 604800)
+            pipe = self.client.pipeline(transaction=True)
+            _queue_save_to_conversation(pipe, thread_id, question, answer)
+            await pipe.execute()
         except Exception as e:
             print(f"Error guardando en historial: {e}")
 
 
-redis_cache = RedisCache()
+async_redis_cache = AsyncRedisCache()
@@ -0,0 +1,84 @@
+import os
+from typing import List, Optional
+
+import httpx
+from langchain_core.documents import Document
+
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "true").lower() == "true"
+RERANK_SERVICE_URL = os.getenv("RERANK_SERVICE_URL", "http://embedding_service:8001/rerank")
+RERANK_TIMEOUT = float(os.getenv("RERANK_TIMEOUT", 10))
+# Candidatos que trae el retrieval y pasajes que quedan después del reranking
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", 20))
+RERANK_TOP_N = int(os.getenv("RERANK_TOP_N", 4))
+
+
+class Reranker:
+    """
+    Cliente del endpoint /rerank de embedding_service (cross-encoder).
+
+    Reduce los candidatos del retrieval a los `top_n` pasajes más relevantes
+    para la pregunta. Si el servicio falla devuelve los primeros `top_n` en el
+    orden del retrieval, sin cortar la respuesta.
+    """
+
+    def __init__(
+        self,
+        url: str = RERANK_SERVICE_URL,
+        candidates: int = RERANK_CANDIDATES,
+        top_n: int = RERANK_TOP_N,
+        enabled: bool = RERANK_ENABLED,
+    ):
+        self.url = url
+        self.candidates = candidates
+        self.top_n = top_n
+        self.enabled = enabled
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self.calls = 0
+        self.errors = 0
+
+    def _get_async_client(self) -> httpx.AsyncClient:
+        if self._async_client is None or self._async_client.is_closed:
+            self._async_client = httpx.AsyncClient(timeout=RERANK_TIMEOUT)
+        return self._async_client
+
+    def candidates_for(self, k: int) -> int:
+        """Cantidad de documentos a pedir al retrieval para una ruta con `k` documentos"""
+        return max(k, self.candidates) if self.enabled else k
+
+    def _payload(self, question: str, documents: List[Document]) -> dict:
+        return {"query": question, "passages": [d.page_content for d in documents], "top_k": self.top_n}
+
+    def _select(self, documents: List[Document], response: httpx.Response) -> List[Document]:
+        response.raise_for_status()
+        self.calls += 1
+        return [documents[result["index"]] for result in response.json()["results"]]
+
+    def _fallback(self, documents: List[Document], error: Exception) -> List[Document]:
+        self.errors += 1
+        print(f"Advertencia: reranking no disponible, se usan los primeros {self.top_n} documentos: {error}")
+        return documents[:self.top_n]
+
+    async def arerank(self, question: str, documents: List[Document]) -> List[Document]:
+        if not self.enabled or len(documents) <= 1:
+            return documents
+        try:
+            response = await self._get_async_client().post(self.url, json=self._payload(question, documents))
+            return self._select(documents, response)
+        except Exception as e:
+            return self._fallback(documents, e)
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "candidates": self.candidates,
+            "top_n": self.top_n,
+            "calls": self.calls,
+            "errors": self.errors,
+        }
+
+
+reranker = Reranker()
@@ -0,0 +1,148 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional
+
+from langchain_core.documents import Document
+from models.qdrant_schemas import DOCS_COLLECTION
+from models.redis_cache import CACHE_TTL, async_redis_cache, normalize_question
+
+RETRIEVAL_CACHE_ENABLED = os.getenv("RETRIEVAL_CACHE_ENABLED", "true").lower() == "true"
+RETRIEVAL_CACHE_MEMORY_ITEMS = int(os.getenv("RETRIEVAL_CACHE_MEMORY_ITEMS", 1024))
+RETRIEVAL_CACHE_TTL = int(os.getenv("RETRIEVAL_CACHE_TTL", CACHE_TTL))
+# Cada cuánto se relee la versión del corpus de Redis (cota de staleness del LRU tras una ingesta)
+CORPUS_VERSION_REFRESH = float(os.getenv("CORPUS_VERSION_REFRESH", 5))
+
+
+class RetrievalCache:
+    """
+    Cache de resultados de búsqueda: (query normalizada, k, tema, colección, versión del corpus) -> documentos.
+
+    Dos niveles: un LRU en memoria y Redis compartido entre réplicas. La versión
+    del corpus forma parte de la clave, así que una ingesta nueva (evento
+    `etl_done`) invalida todas las entradas anteriores sin tener que borrarlas.
+
+    El evento lo consume un solo worker: ese pasa a la versión nueva enseguida
+    (`invalidate`) y los demás la toman al releerla de Redis, con una demora de
+    a lo sumo CORPUS_VERSION_REFRESH segundos.
+    """
+
+    def __init__(
+        self,
+        collection: str = DOCS_COLLECTION,
+        memory_items: int = RETRIEVAL_CACHE_MEMORY_ITEMS,
+        ttl: int = RETRIEVAL_CACHE_TTL,
+        enabled: bool = RETRIEVAL_CACHE_ENABLED,
+    ):
+        self.collection = collection
+        self.memory_items = memory_items
+        self.ttl = ttl
+        self.enabled = enabled
+        self._memory: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._corpus_version = "0"
+        self._version_checked_at = float("-inf")
+        self.memory_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    def _key(self, query: str, k: int, corpus_version: str, topic: Optional[str] = None) -> str:
+        query_hash = hashlib.sha256(normalize_question(query).encode()).hexdigest()
+        return f"cache:retrieval:{self.collection}:{corpus_version}:{k}:{topic or '*'}:{query_hash}"
+
+    def _version_stale(self) -> bool:
+        return time.monotonic() - self._version_checked_at >= CORPUS_VERSION_REFRESH
+
+    def _set_version(self, corpus_version: Optional[str]):
+        self._corpus_version = corpus_version or "0"
+        self._version_checked_at = time.monotonic()
+
+    def _memory_get(self, key: str) -> Optional[List[Document]]:
+        with self._lock:
+            documents = self._memory.get(key)
+            if documents is not None:
+                self._memory.move_to_end(key)
+            return documents
+
+    def _memory_put(self, key: str, documents: List[Document]):
+        if self.memory_items <= 0:
+            return
+        with self._lock:
+            self._memory[key] = documents
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+
+    @staticmethod
+    def _dumps(documents: List[Document]) -> str:
+        return json.dumps([{"page_content": d.page_content, "metadata": d.metadata} for d in documents])
+
+    @staticmethod
+    def _loads(cached: str) -> List[Document]:
+        return [Document(page_content=d["page_content"], metadata=d["metadata"]) for d in json.loads(cached)]
+
+    def invalidate(self):
+        """Vacía el LRU local y fuerza a releer la versión del corpus en la próxima consulta (solo este worker)"""
+        with self._lock:
+            self._memory.clear()
+        self._version_checked_at = float("-inf")
+
+    async def _acorpus_version(self) -> str:
+        if self._version_stale():
+            try:
+                self._set_version(await async_redis_cache.get_corpus_version())
+            except Exception as e:
+                print(f"Error leyendo la versión del corpus: {e}")
+        return self._corpus_version
+
+    async def aget(self, query: str, k: int, topic: Optional[str] = None) -> Optional[List[Document]]:
+        """Documentos cacheados para la búsqueda (filtrada por `topic` si se indica) o None"""
+        if not self.enabled:
+            return None
+        key = self._key(query, k, await self._acorpus_version(), topic)
+        documents = self._memory_get(key)
+        if documents is not None:
+            self.memory_hits += 1
+            return documents
+        if async_redis_cache.connected:
+            try:
+                cached = await async_redis_cache.client.get(key)
+                if cached:
+                    documents = self._loads(cached)
+                    self._memory_put(key, documents)
+                    self.redis_hits += 1
+                    return documents
+            except Exception as e:
+                print(f"Error consultando el cache de búsquedas: {e}")
+        self.misses += 1
+        return None
+
+    async def aput(self, query: str, k: int, documents: List[Document], topic: Optional[str] = None):
+        if not self.enabled:
+            return
+        key = self._key(query, k, await self._acorpus_version(), topic)
+        self._memory_put(key, documents)
+        if async_redis_cache.connected:
+            try:
+                await async_redis_cache.client.setex(key, self.ttl, self._dumps(documents))
+            except Exception as e:
+                print(f"Error guardando en el cache de búsquedas: {e}")
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.redis_hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "collection": self.collection,
+            "corpus_version": self._corpus_version,
+            "memory_items": len(self._memory),
+            "memory_hits": self.memory_hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.redis_hits) / lookups if lookups else 0.0,
+        }
+
+
+retrieval_cache = RetrievalCache()
@@ -0,0 +1,158 @@
+import os
+import random
+import time
+import uuid
+from typing import List, Optional
+
+from qdrant_client import models as qmodels
+from models.qdrant_collections import aensure_collection, search_params
+from models.qdrant_schemas import _get_async_client, _get_embedding_function
+from models.redis_cache import CACHE_TTL, question_cache_key
+
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+SEMANTIC_CACHE_COLLECTION = os.getenv("SEMANTIC_CACHE_COLLECTION", "semantic_cache")
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.93))
+SEMANTIC_CACHE_TTL = int(os.getenv("SEMANTIC_CACHE_TTL", CACHE_TTL))
+# En promedio una de cada SEMANTIC_CACHE_PURGE_EVERY escrituras borra los puntos vencidos
+SEMANTIC_CACHE_PURGE_EVERY = int(os.getenv("SEMANTIC_CACHE_PURGE_EVERY", 100))
+PAYLOAD_INDEXES = {"created_at": qmodels.PayloadSchemaType.FLOAT}
+
+
+class SemanticCache:
+    """
+    Cache de respuestas por similitud semántica de la pregunta.
+
+    Guarda el embedding de cada pregunta respondida en una colección dedicada de
+    Qdrant y sirve la respuesta cacheada cuando una pregunta nueva supera
+    `threshold` de similitud coseno. Las entradas vencen a los `ttl` segundos:
+    las lecturas las ignoran y las escrituras las borran cada tanto, así la
+    colección no crece con cada pregunta distinta.
+    """
+
+    def __init__(
+        self,
+        collection: str = SEMANTIC_CACHE_COLLECTION,
+        threshold: float = SEMANTIC_CACHE_THRESHOLD,
+        ttl: int = SEMANTIC_CACHE_TTL,
+        enabled: bool = SEMANTIC_CACHE_ENABLED,
+    ):
+        self.collection = collection
+        self.threshold = threshold
+        self.ttl = ttl
+        self.enabled = enabled
+        self._ready = False
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def _point_id(self, question: str) -> str:
+        # Misma normalización que el cache exacto: la misma pregunta sobrescribe su entrada
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, question_cache_key(question)))
+
+    def _fresh_filter(self) -> qmodels.Filter:
+        return qmodels.Filter(
+            must=[qmodels.FieldCondition(key="created_at", range=qmodels.Range(gte=time.time() - self.ttl))]
+        )
+
+    def _created_before(self, timestamp: float) -> qmodels.FilterSelector:
+        return qmodels.FilterSelector(filter=qmodels.Filter(
+            must=[qmodels.FieldCondition(key="created_at", range=qmodels.Range(lt=timestamp))]
+        ))
+
+    def _point(self, question: str, answer: str, embedding: List[float]) -> qmodels.PointStruct:
+        return qmodels.PointStruct(
+            id=self._point_id(question),
+            vector=embedding,
+            payload={"question": question, "answer": answer, "created_at": time.time()},
+        )
+
+    def _record(self, hit: Optional[qmodels.ScoredPoint]) -> Optional[str]:
+        if hit is None or hit.score < self.threshold:
+            self.misses += 1
+            return None
+        self.hits += 1
+        print(f"🧠 Cache semántico: '{hit.payload.get('question')}' (similitud {hit.score:.3f})")
+        return hit.payload.get("answer")
+
+    def _error(self, action: str, error: Exception):
+        self.errors += 1
+        # Si la colección ya no existe (p. ej. borrada a mano) se vuelve a crear en la próxima llamada
+        self._ready = False
+        print(f"Error {action} el cache semántico: {error}")
+
+    async def _aensure_collection(self):
+        if self._ready:
+            return
+        await aensure_collection(_get_async_client(), self.collection, payload_indexes=PAYLOAD_INDEXES)
+        self._ready = True
+
+    async def aget(self, question: str, embedding: Optional[List[float]] = None) -> Optional[str]:
+        """Devuelve la respuesta de la pregunta cacheada más parecida si supera el umbral"""
+        if not self.enabled:
+            return None
+        try:
+            await self._aensure_collection()
+            if embedding is None:
+                embedding = await _get_embedding_function().aembed_query(question)
+            result = await _get_async_client().query_points(
+                collection_name=self.collection,
+                query=embedding,
+                query_filter=self._fresh_filter(),
+                search_params=search_params(),
+                limit=1,
+                with_payload=["question", "answer"],
+            )
+            return self._record(result.points[0] if result.points else None)
+        except Exception as e:
+            self._error("consultando", e)
+            return None
+
+    async def aput(self, question: str, answer: str, embedding: Optional[List[float]] = None):
+        if not self.enabled:
+            return
+        try:
+            await self._aensure_collection()
+            if embedding is None:
+                embedding = await _get_embedding_function().aembed_query(question)
+            await _get_async_client().upsert(
+                collection_name=self.collection,
+                points=[self._point(question, answer, embedding)],
+            )
+            if random.random() * SEMANTIC_CACHE_PURGE_EVERY < 1:
+                await _get_async_client().delete(
+                    collection_name=self.collection, points_selector=self._created_before(time.time() - self.ttl)
+                )
+        except Exception as e:
+            self._error("guardando en", e)
+
+    async def aclear(self):
+        """
+        Vacía el cache semántico (p. ej. después de una nueva ingesta).
+
+        Borra los puntos y conserva la colección: el evento lo recibe un solo
+        worker y el resto sigue usándola sin tener que volver a crearla.
+        """
+        if not self.enabled:
+            return
+        try:
+            await self._aensure_collection()
+            await _get_async_client().delete(
+                collection_name=self.collection, points_selector=self._created_before(time.time())
+            )
+        except Exception as e:
+            self._error("vaciando", e)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "collection": self.collection,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+semantic_cache = SemanticCache()
@@ -0,0 +1,221 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+from typing import Awaitable, Callable, Optional
+
+SINGLE_FLIGHT_LOCK_TTL = int(os.getenv("SINGLE_FLIGHT_LOCK_TTL", 180))
+SINGLE_FLIGHT_WAIT_TIMEOUT = float(os.getenv("SINGLE_FLIGHT_WAIT_TIMEOUT", 180))
+
+# Borra el lock solo si sigue siendo nuestro (el TTL pudo vencer y otro líder tomarlo)
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+LEADER = "leader"
+LOCAL = "local"
+REMOTE = "remote"
+
+
+class Flight:
+    """
+    Participación en una ejecución para una clave.
+
+    - leader: debe producir el resultado y llamar a `complete`
+    - local: otro llamador de este proceso lo está produciendo
+    - remote: otra réplica tiene el lock de Redis
+
+    Un seguidor que queda sin resultado (líder cancelado o caído) puede pasar a
+    ser líder: `kind`, `future` y `token` se actualizan en el mismo objeto.
+    """
+
+    def __init__(self, key: str, kind: str, future: asyncio.Future, token: Optional[str] = None):
+        self.key = key
+        self.kind = kind
+        self.future = future
+        self.token = token
+
+
+class SingleFlight:
+    """
+    Deduplicación de trabajo idéntico en curso (single-flight).
+
+    Dentro del proceso, los llamadores de una misma clave comparten un future.
+    Entre réplicas, el líder toma un lock corto en Redis (SET NX EX) y publica
+    el resultado por pub/sub; los seguidores lo esperan. Si el líder remoto
+    muere o falla, el seguidor calcula el resultado por su cuenta.
+
+    Solo los errores (`Exception`) se propagan a los seguidores locales. Si el
+    líder se cancela (cliente desconectado, request cancelado) el Flight se
+    abandona: los seguidores vuelven a consultar el cache y uno toma el relevo.
+    """
+
+    def __init__(self, redis_cache, lock_ttl: int = SINGLE_FLIGHT_LOCK_TTL, wait_timeout: float = SINGLE_FLIGHT_WAIT_TIMEOUT):
+        self.redis_cache = redis_cache
+        self.lock_ttl = lock_ttl
+        self.wait_timeout = wait_timeout
+        self._inflight: dict[str, asyncio.Future] = {}
+        self.leaders = 0
+        self.local_followers = 0
+        self.remote_followers = 0
+
+    def _lock_key(self, key: str) -> str:
+        return f"singleflight:lock:{key}"
+
+    def _channel(self, key: str) -> str:
+        return f"singleflight:result:{key}"
+
+    async def acquire(self, key: str) -> Flight:
+        future = self._inflight.get(key)
+        if future is not None:
+            self.local_followers += 1
+            return Flight(key, LOCAL, future)
+
+        # Registrar antes de cualquier await para que los llamadores locales se unan a este future
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+
+        if not self.redis_cache.connected:
+            self.leaders += 1
+            return Flight(key, LEADER, future)
+
+        token = uuid.uuid4().hex
+        try:
+            acquired = await self.redis_cache.client.set(self._lock_key(key), token, nx=True, ex=self.lock_ttl)
+        except Exception as e:
+            print(f"Error tomando lock de single-flight: {e}")
+            self.leaders += 1
+            return Flight(key, LEADER, future)
+
+        if acquired:
+            self.leaders += 1
+            return Flight(key, LEADER, future, token)
+        self.remote_followers += 1
+        return Flight(key, REMOTE, future)
+
+    async def wait(self, flight: Flight, check: Callable[[], Awaitable[Optional[str]]]) -> Optional[str]:
+        """
+        Espera el resultado de un Flight seguidor.
+
+        Para REMOTE devuelve None si no llegó resultado (líder caído o con error):
+        en ese caso el llamador pasa a ser líder local y debe llamar a `complete`.
+        """
+        if flight.kind == LOCAL:
+            result = await asyncio.shield(flight.future)
+            if result is not None:
+                return result
+            # Líder cancelado: la respuesta pudo quedar en cache; si no, uno de los seguidores toma el relevo
+            result = await check()
+            if result is not None:
+                return result
+            renewed = await self.acquire(flight.key)
+            flight.kind, flight.future, flight.token = renewed.kind, renewed.future, renewed.token
+            if flight.kind == LEADER:
+                return None
+            return await self.wait(flight, check)
+
+        result = None
+        pubsub = self.redis_cache.client.pubsub()
+        try:
+            await pubsub.subscribe(self._channel(flight.key))
+            # El líder pudo terminar antes de la suscripción
+            result = await check()
+            deadline = time.monotonic() + self.wait_timeout
+            while result is None and time.monotonic() < deadline:
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if message is not None:
+                    result = json.loads(message["data"]).get("result")
+                    break
+                if not await self.redis_cache.client.exists(self._lock_key(flight.key)):
+                    # Lock liberado sin mensaje: líder caído o terminado justo ahora
+                    result = await check()
+                    break
+        except Exception as e:
+            print(f"Error esperando resultado de single-flight: {e}")
+        except BaseException:
+            # Seguidor remoto cancelado: los locales que esperaban su future no quedan colgados
+            await self.abandon(flight)
+            raise
+        finally:
+            try:
+                await pubsub.unsubscribe()
+                await pubsub.aclose()
+            except Exception:
+                pass
+
+        if result is not None:
+            await self.complete(flight, result)
+        else:
+            flight.kind = LEADER
+        return result
+
+    async def complete(self, flight: Flight, result: Optional[str] = None, error: Optional[Exception] = None):
+        """Entrega el resultado (o el error) a los seguidores locales y remotos y libera el lock"""
+        if self._inflight.get(flight.key) is flight.future:
+            del self._inflight[flight.key]
+        if not flight.future.done():
+            if error is not None:
+                flight.future.set_exception(error)
+                # Marcar como recuperada para no loguear "exception was never retrieved" sin seguidores
+                flight.future.exception()
+            else:
+                flight.future.set_result(result)
+        await self._release(flight, {"result": result} if error is None else {"error": str(error)})
+
+    async def abandon(self, flight: Flight):
+        """
+        Libera el Flight de un llamador cancelado sin propagar la cancelación.
+
+        Los seguidores locales reciben None y los remotos un error: vuelven a
+        consultar el cache y, si no hay respuesta, uno de ellos pasa a ser líder.
+        """
+        if self._inflight.get(flight.key) is flight.future:
+            del self._inflight[flight.key]
+        if not flight.future.done():
+            flight.future.set_result(None)
+        await self._release(flight, {"error": "cancelado"})
+
+    async def _release(self, flight: Flight, payload: dict):
+        if flight.token is None:
+            return
+        try:
+            await self.redis_cache.client.publish(self._channel(flight.key), json.dumps(payload))
+            await self.redis_cache.client.eval(_RELEASE_SCRIPT, 1, self._lock_key(flight.key), flight.token)
+        except Exception as e:
+            print(f"Error liberando lock de single-flight: {e}")
+
+    async def do(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[str]],
+        check: Callable[[], Awaitable[Optional[str]]],
+    ) -> str:
+        """Ejecuta `fn` una sola vez por clave; los demás llamadores reciben el mismo resultado"""
+        flight = await self.acquire(key)
+        if flight.kind != LEADER:
+            result = await self.wait(flight, check)
+            if result is not None:
+                return result
+
+        try:
+            result = await fn()
+        except Exception as e:
+            await self.complete(flight, error=e)
+            raise
+        except BaseException:
+            await self.abandon(flight)
+            raise
+        await self.complete(flight, result)
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "inflight": len(self._inflight),
+            "leaders": self.leaders,
+            "local_followers": self.local_followers,
+            "remote_followers": self.remote_followers,
+        }